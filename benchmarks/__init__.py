@@ -0,0 +1,5 @@
+"""Load-testing and benchmark suite for the IESCP routes.
+
+python -m benchmarks fills a throwaway database with benchmarks.datagen, drives every route
+with benchmarks.driver and compares the numbers with a stored baseline through benchmarks.report.
+"""
@@ -0,0 +1,76 @@
+"""Usage: python -m benchmarks [--out run.json] [--baseline benchmarks/baseline.json] [sizes and run options]
+
+Seeds a throwaway database, drives every route and optionally fails (exit code 1) when the run
+regressed against the baseline. Never touches the database next to main.py.
+"""
+import argparse
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks import report
+from benchmarks.datagen import DEFAULT_SIZES
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark every IESCP route')
+    for name, size in DEFAULT_SIZES.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=size, help='rows to generate (default %d)' % size)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route before timing')
+    parser.add_argument('--only', nargs='*', help='run only these scenarios')
+    parser.add_argument('--no-cache', action='store_true', help='run with the dashboard cache disabled')
+    parser.add_argument('--query-budget', type=int, help='fail every request that runs more queries than this')
+    parser.add_argument('--out', help='write the results to this JSON file, e.g. to record a new baseline')
+    parser.add_argument('--baseline', help='compare with this JSON file and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth of response bytes')
+    parser.add_argument('--latency-tolerance', type=float, default=0.5, help='allowed relative growth of p50 latency')
+    parser.add_argument('--min-ms', type=float, default=5.0, help='p50 growth below this many ms is never a regression')
+    parser.add_argument('--metrics', default=','.join(report.METRICS), help='metrics to compare, e.g. queries,bytes')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    if args.no_cache:
+        os.environ['IESCP_CACHE_TTL'] = '0'
+    if args.query_budget:
+        os.environ['IESCP_QUERY_BUDGET'] = str(args.query_budget)
+        os.environ['IESCP_QUERY_BUDGET_STRICT'] = '1'
+
+    from benchmarks import datagen, driver
+
+    sizes = {name: getattr(args, name) for name in DEFAULT_SIZES}
+    with driver.app.app_context():
+        driver.upgrade_db()
+        started = time.perf_counter()
+        datagen.seed_database(driver.db, {'User': driver.User, 'Campaign': driver.Campaign, 'AdRequest': driver.AdRequest}, sizes, args.seed)
+        print('Seeded %s in %.1fs' % (sizes, time.perf_counter() - started))
+        routes, uncovered = driver.run(iterations=args.iterations, warmup=args.warmup, only=args.only)
+    if uncovered:
+        print('Routes without a scenario:', ', '.join(uncovered))
+    current = {'meta': {'sizes': sizes, 'seed': args.seed, 'iterations': args.iterations, 'cache': not args.no_cache,
+                        'python': platform.python_version(), 'machine': platform.machine()},
+               'routes': routes}
+    if args.out:
+        report.save(args.out, current)
+        print('Results written to', args.out)
+    if args.baseline:
+        baseline = report.load(args.baseline)
+        print('\n'.join(report.summary(baseline, current)))
+        problems = report.compare(baseline, current, args.tolerance, args.latency_tolerance, args.min_ms, args.metrics.split(','),
+                                  partial=bool(args.only))
+        for name, message in problems:
+            print('REGRESSION %s: %s' % (name, message))
+        if problems:
+            return 1
+        print('No regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
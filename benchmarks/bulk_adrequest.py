@@ -0,0 +1,71 @@
+"""Times a bulk ad request fanned out to many influencers and checks no pair ends up with two pending requests.
+
+Usage: python benchmarks/bulk_adrequest.py [influencers]
+
+Every tenth influencer already has a pending request for the first campaign, and those must come
+back already_pending. The same fan-out is then sent to a second campaign from two clients at once,
+where each influencer must be sent exactly one request between the two. Runs against a throwaway database.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import PASSWORD, insert_chunks  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from main import app, db, upgrade_db, User, Campaign, AdRequest  # noqa: E402
+
+
+def send(campaign_id, influencer_ids, results):
+    client = app.test_client()
+    client.post('/login', data={'username': 'sponsor', 'password': PASSWORD})
+    started = time.perf_counter()
+    response = client.post('/sponsor/campaigns/%d/bulk_adrequest' % campaign_id, json={'influencer_ids': influencer_ids, 'requirements': 'one post', 'payment_amount': 100})
+    results.append((time.perf_counter() - started, response.status_code, response.get_json()))
+
+
+def main():
+    size = int((sys.argv[1:] or ['10000'])[0])
+    with app.app_context():
+        upgrade_db()
+        insert_chunks(db, User, [dict(username='sponsor', name='Sponsor', email='sponsor@example.com', password=generate_password_hash(PASSWORD), is_sponsor=True)]
+                      + [dict(username=f'inf{i}', name=f'Influencer {i}', email=f'inf{i}@example.com', password='x', is_influencer=True) for i in range(size)])
+        insert_chunks(db, Campaign, [dict(name='Campaign', description='Campaign', start_date=date(2024, 1, 1), end_date=date(2030, 1, 1),
+                                          budget=1000, sponsor_id=1)] * 2)
+        insert_chunks(db, AdRequest, [dict(campaign_id=1, influencer_id=2 + i, requirements='post', payment_amount=10) for i in range(0, size, 10)])
+        db.session.commit()
+    influencer_ids = list(range(2, size + 2))
+
+    results = []
+    send(1, influencer_ids, results)
+    elapsed, status, body = results[0]
+    counts = {}
+    for result in body['results'].values():
+        counts[result] = counts.get(result, 0) + 1
+    print(f'{size} influencers answered {status} in {elapsed:.2f}s: {counts}')
+    assert status == 200 and counts == {'sent': size - len(range(0, size, 10)), 'already_pending': len(range(0, size, 10))}, counts
+
+    results = []
+    threads = [threading.Thread(target=send, args=(2, influencer_ids, results)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for elapsed, status, body in results:
+        print(f'concurrent fan-out answered {status} in {elapsed:.2f}s, {body["sent"]} sent')
+        assert status == 200, status
+    assert sum(body['sent'] for _, _, body in results) == size, 'an influencer was sent two requests or none'
+    with app.app_context():
+        pending = db.session.execute(db.select(db.func.count()).select_from(AdRequest).filter(AdRequest.campaign_id == 2, AdRequest.status_adreq == 'pending')).scalar()
+    assert pending == size, pending
+    print('ok')
+
+
+if __name__ == '__main__':
+    main()
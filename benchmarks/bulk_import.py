@@ -0,0 +1,73 @@
+"""Times the import-data command on a generated file of influencers.
+
+Usage: python benchmarks/bulk_import.py [influencers] [csv|ndjson]
+
+One row in a hundred is broken or repeats an earlier username or email, so validation and the
+error report are part of the timing. Passwords are hashed with IESCP_PASSWORD_METHOD on
+IESCP_IMPORT_WORKERS processes, so the rate mostly measures the hash cost and the core count; set
+a cheaper IESCP_PASSWORD_METHOD to time the rest of the import. Runs against a throwaway database.
+"""
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FOLDER = tempfile.mkdtemp()
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + os.path.join(FOLDER, 'bench.sqlite3')
+sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import CATEGORIES, NICHES, FIRST, LAST  # noqa: E402
+from main import app, db, upgrade_db, User  # noqa: E402
+
+FIELDS = ['username', 'name', 'email', 'password', 'inf_category', 'inf_niche', 'inf_reach']
+
+
+def records(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        record = dict(username=f'agency{i}', name=f'{rng.choice(FIRST)} {rng.choice(LAST)}', email=f'agency{i}@example.com',
+                      password=f'welcome-{rng.getrandbits(32):08x}', inf_category=rng.choice(CATEGORIES),
+                      inf_niche=rng.choice(NICHES), inf_reach=int(rng.paretovariate(1.1) * 1000))
+        if i % 100 == 99:
+            record.update(rng.choice([dict(username=f'agency{i - 1}'), dict(email=f'agency{i - 2}@example.com'),
+                                      dict(inf_reach='lots'), dict(password='')]))
+        yield record
+
+
+def write_file(count, file_format):
+    path = os.path.join(FOLDER, 'influencers.' + file_format)
+    with open(path, 'w', newline='') as f:
+        if file_format == 'csv':
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writeheader()
+            writer.writerows(records(count))
+        else:
+            f.writelines(json.dumps(record) + '\n' for record in records(count))
+    return path
+
+
+def main():
+    count, file_format = (sys.argv[1:] + ['100000', 'csv'][len(sys.argv) - 1:])[:2]
+    count = int(count)
+    path = write_file(count, file_format)
+    with app.app_context():
+        upgrade_db()
+    print(f'{count} influencers, {app.config["PASSWORD_METHOD"]}, {app.config["IMPORT_WORKERS"] or os.cpu_count()} hashing processes, '
+          f'batches of {app.config["IMPORT_BATCH_SIZE"]}')
+    started = time.perf_counter()
+    result = app.test_cli_runner().invoke(args=['import-data', 'influencers', path])
+    elapsed = time.perf_counter() - started
+    print(result.output.strip())
+    if result.exception:
+        raise result.exception
+    with app.app_context():
+        imported = db.session.execute(db.select(db.func.count()).select_from(User).filter(User.is_influencer == True)).scalar()
+    print(f'{imported} influencers in the database, {count / elapsed:.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Times deleting a campaign with many ad requests and how long other writers wait meanwhile.
+
+Usage: python benchmarks/campaign_delete.py [ad requests]
+
+The sponsor's delete request only hides the campaign and the purge removes its ad requests in
+LIFECYCLE_BATCH_SIZE batches. A second thread keeps inserting ad requests on another campaign
+the whole time and reports its slowest commit. Runs against a throwaway database.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import PASSWORD, insert_chunks  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from main import app, db, upgrade_db, purge_lock, User, Campaign, AdRequest  # noqa: E402
+
+
+def main():
+    size = int((sys.argv[1:] or ['50000'])[0])
+    with app.app_context():
+        upgrade_db()
+        insert_chunks(db, User, [dict(username='sponsor', name='Sponsor', email='sponsor@example.com', password=generate_password_hash(PASSWORD), is_sponsor=True)]
+                      + [dict(username=f'inf{i}', name=f'Influencer {i}', email=f'inf{i}@example.com', password='x', is_influencer=True) for i in range(1000)])
+        insert_chunks(db, Campaign, [dict(name=f'Campaign {i}', description='Campaign', start_date=date(2024, 1, 1), end_date=date(2030, 1, 1),
+                                          budget=1000, sponsor_id=1) for i in range(2)])
+        insert_chunks(db, AdRequest, [dict(campaign_id=1, influencer_id=2 + i % 1000, requirements='post', payment_amount=10,
+                                           status_adreq='pending' if i < 1000 else ('accepted', 'rejected')[i % 2]) for i in range(size)])
+        db.session.commit()
+
+    stalls = []
+    done = threading.Event()
+
+    def write():
+        with app.app_context():
+            while not done.is_set():
+                started = time.perf_counter()
+                #answered, a pending one would be refused after the first: a pair has one pending ad request at most
+                db.session.add(AdRequest(campaign_id=2, influencer_id=2, requirements='post', payment_amount=10, status_adreq='accepted'))
+                db.session.commit()
+                stalls.append(time.perf_counter() - started)
+                time.sleep(0.001)
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'sponsor', 'password': PASSWORD})
+    writer = threading.Thread(target=write)
+    writer.start()
+    started = time.perf_counter()
+    client.get('/sponsor/campaigns/1/delete')
+    answered = time.perf_counter() - started
+    time.sleep(0.05)
+    with purge_lock:
+        purged = time.perf_counter() - started
+    done.set()
+    writer.join()
+    with app.app_context():
+        left = db.session.execute(db.select(db.func.count()).select_from(AdRequest).filter(AdRequest.campaign_id == 1)).scalar()
+
+    print(f'{size} ad requests, batches of {app.config["LIFECYCLE_BATCH_SIZE"]}')
+    print(f'delete answered in {answered * 1000:.1f}ms, purge finished after {purged * 1000:.0f}ms, {left} ad requests left')
+    print(f'other writer: {len(stalls)} commits, slowest {max(stalls) * 1000:.1f}ms, '
+          f'p50 {sorted(stalls)[len(stalls) // 2] * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Compares the FTS5 campaign search with the old ilike search.
+
+Usage: python benchmarks/campaign_search.py [number_of_campaigns]
+
+Runs against a throwaway database, never the one next to main.py.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + DB_PATH
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from datetime import date  # noqa: E402
+
+from main import app, db, User, Campaign, search_campaigns, upgrade_db  # noqa: E402
+
+WORDS = ('summer sale fitness travel beauty gaming tech launch vegan coffee skincare fashion music '
+         'podcast running outdoor budget luxury family pets kitchen finance crypto books art').split()
+SEARCHES = ['fitness', 'vegan coffee', 'gam', 'luxury travel fashion']
+RUNS = 5
+
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def seed(count):
+    rng = random.Random(42)
+    sponsor = User(username='bench', name='Bench', email='bench@example.com', password='x', is_sponsor=True)
+    db.session.add(sponsor)
+    db.session.flush()
+    rows = [dict(name=sentence(rng, 3), description=sentence(rng, 30), goals=sentence(rng, 8),
+                 start_date=date(2024, 1, 1), end_date=date(2030, 1, 1), budget=rng.randint(100, 100000),
+                 visibility=rng.choice(('public', 'public', 'private')),
+                 status_camp=rng.choice(('ongoing', 'ongoing', 'completed')), sponsor_id=sponsor.id)
+            for _ in range(count)]
+    db.session.execute(db.insert(Campaign), rows)
+    db.session.commit()
+
+
+def ilike_search(query):
+    search_filter = f"%{query}%"
+    return db.select(Campaign).filter(Campaign.visibility == "public", (Campaign.name.ilike(search_filter) | Campaign.description.ilike(search_filter) | Campaign.goals.ilike(search_filter)))
+
+
+def timed(fn):
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with app.app_context():
+        upgrade_db()
+        start = time.perf_counter()
+        seed(count)
+        print(f'seeded {count} campaigns in {time.perf_counter() - start:.1f}s ({DB_PATH})')
+        print(f'{"query":<24}{"ilike ms":>10}{"rows":>8}{"fts page ms":>14}{"matches":>9}')
+        for query in SEARCHES:
+            ilike_ms, rows = timed(lambda: db.session.execute(ilike_search(query)).scalars().all())
+            fts_ms, page = timed(lambda: db.paginate(search_campaigns(query), page=1, per_page=app.config['CAMPAIGNS_PAGE_SIZE']))
+            db.session.expunge_all()
+            print(f'{query:<24}{ilike_ms:>10.1f}{len(rows):>8}{fts_ms:>14.1f}{page.total:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Hammers the accept/reject routes from many threads at once and checks every ad request changed state exactly once.
+
+A trigger on the throwaway database records every status change, so a request answered twice shows up as two rows.
+
+Usage: python benchmarks/concurrent_answers.py [threads] [ad_requests]
+
+Runs against a throwaway database, never the one next to main.py.
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + DB_PATH
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from datetime import date  # noqa: E402
+
+from sqlalchemy import text  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from main import app, db, User, Campaign, AdRequest, upgrade_db  # noqa: E402
+
+
+def seed(count):
+    password = generate_password_hash('password')
+    sponsor = User(username='sponsor', name='Sponsor', email='sponsor@example.com', password=password, is_sponsor=True)
+    influencer = User(username='influencer', name='Influencer', email='influencer@example.com', password=password, is_influencer=True)
+    db.session.add_all([sponsor, influencer])
+    db.session.flush()
+    #one campaign per ad request, the influencer can only have one pending request on each
+    campaigns = [Campaign(name='Campaign', description='Campaign', end_date=date(2030, 1, 1), budget=1000, sponsor_id=sponsor.id) for _ in range(count)]
+    db.session.add_all(campaigns)
+    db.session.flush()
+    db.session.execute(db.insert(AdRequest), [dict(campaign_id=campaign.id, influencer_id=influencer.id, requirements='post',
+                                                   payment_amount=10, created_by='sponsor') for campaign in campaigns])
+    db.session.execute(text("CREATE TABLE status_changes (ad_request_id INTEGER, status_adreq TEXT)"))
+    db.session.execute(text("CREATE TRIGGER record_status_change AFTER UPDATE OF status_adreq ON ad_requests BEGIN "
+                            "INSERT INTO status_changes VALUES (new.id, new.status_adreq); END"))
+    db.session.commit()
+    return db.session.execute(db.select(AdRequest.id)).scalars().all()
+
+
+def worker(ad_request_ids, errors, seed_value):
+    rng = random.Random(seed_value)
+    client = app.test_client()
+    client.post('/login', data={'username': 'influencer', 'password': 'password'})
+    for ad_request_id in rng.sample(ad_request_ids, len(ad_request_ids)):
+        response = client.get('/adrequests/%d/%s' % (ad_request_id, rng.choice(('accept', 'reject'))))
+        if response.status_code != 302:
+            errors.append(response.status_code)
+    response = client.post('/adrequests/bulk', json={'action': 'accept', 'ad_request_ids': ad_request_ids})
+    if response.status_code != 200:
+        errors.append(response.status_code)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with app.app_context():
+        upgrade_db()
+        ad_request_ids = seed(count)
+    errors = []
+    workers = [threading.Thread(target=worker, args=(ad_request_ids, errors, i)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        pending = AdRequest.query.filter_by(status_adreq='pending').count()
+        changes = db.session.execute(text("SELECT ad_request_id, COUNT(*) FROM status_changes GROUP BY ad_request_id")).all()
+    print(f'{threads} threads x {count} ad requests in {elapsed:.2f}s: {sum(n for _, n in changes)} transitions, {pending} still pending, {len(errors)} errors')
+    assert not errors, errors
+    assert pending == 0
+    assert len(changes) == count and all(n == 1 for _, n in changes), 'an ad request changed state more than once'
+    print('ok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Compares read/write throughput with SQLite's default settings and with the tuned engine profile in main.py.
+
+Usage: python benchmarks/concurrent_read_write.py [seconds] [readers] [writers]
+
+Each profile runs in its own process against a throwaway database, never the one next to main.py.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def child(seconds, readers, writers):
+    os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    sys.path.insert(0, ROOT)
+    from datetime import date
+    from sqlalchemy.exc import OperationalError
+    from main import app, db, User, Campaign, AdRequest, upgrade_db
+
+    with app.app_context():
+        upgrade_db()
+        sponsor = User(username='sponsor', name='Sponsor', email='sponsor@example.com', password='x', is_sponsor=True)
+        db.session.add(sponsor)
+        db.session.flush()
+        db.session.execute(db.insert(User), [dict(username=f'inf{i}', name=f'Influencer {i}', email=f'inf{i}@example.com',
+                                                  password='x', is_influencer=True) for i in range(200)])
+        db.session.execute(db.insert(Campaign), [dict(name=f'Campaign {i}', description='Campaign', start_date=date(2024, 1, 1),
+                                                      end_date=date(2030, 1, 1), budget=1000, sponsor_id=sponsor.id) for i in range(1000)])
+        db.session.commit()
+        sponsor_id = sponsor.id
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def run(work, key):
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                try:
+                    work()
+                    with lock:
+                        counts[key] += 1
+                except OperationalError:
+                    db.session.rollback()
+                    with lock:
+                        counts['errors'] += 1
+
+    def read():
+        Campaign.query.filter(Campaign.status_camp == 'ongoing', Campaign.sponsor_id == sponsor_id).limit(50).all()
+        AdRequest.query.join(Campaign).filter(Campaign.sponsor_id == sponsor_id, AdRequest.status_adreq == 'pending').limit(50).all()
+        db.session.rollback()
+
+    def write():
+        #answered, the pairs repeat after 1000 writes and a pair has one pending ad request at most
+        db.session.add(AdRequest(campaign_id=1 + counts['writes'] % 1000, influencer_id=2 + counts['writes'] % 200, requirements='post', payment_amount=10,
+                                 status_adreq='accepted'))
+        db.session.commit()
+
+    threads = [threading.Thread(target=run, args=(read, 'reads')) for _ in range(readers)]
+    threads += [threading.Thread(target=run, args=(write, 'writes')) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        counts['journal_mode'] = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+    print(json.dumps(counts))
+
+
+def main():
+    seconds, readers, writers = (sys.argv[1:] + ['10', '8', '4'][len(sys.argv) - 1:])[:3]
+    print(f'{seconds}s, {readers} reader threads, {writers} writer threads')
+    print(f'{"profile":<10}{"journal":>9}{"reads/s":>10}{"writes/s":>10}{"errors":>8}')
+    for profile, tuning in (('default', '0'), ('tuned', '1')):
+        output = subprocess.run([sys.executable, __file__, '--child', seconds, readers, writers], capture_output=True, text=True,
+                                env=dict(os.environ, IESCP_SQLITE_TUNING=tuning), check=True).stdout
+        counts = json.loads(output.strip().splitlines()[-1])
+        print(f'{profile:<10}{counts["journal_mode"]:>9}{counts["reads"] / float(seconds):>10.0f}'
+              f'{counts["writes"] / float(seconds):>10.0f}{counts["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(float(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main()
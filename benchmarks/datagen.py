@@ -0,0 +1,85 @@
+"""Seeded synthetic data for benchmarks: sponsors, influencers, campaigns and ad requests.
+
+Sizes follow a long tail like real traffic: a few sponsors own most campaigns, a few campaigns
+attract most ad requests and influencer reach is Pareto distributed.
+"""
+import random
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+PASSWORD = 'password'
+DEFAULT_SIZES = {'sponsors': 200, 'influencers': 5000, 'campaigns': 2000, 'ad_requests': 20000}
+CHUNK = 5000
+
+WORDS = ('summer sale fitness travel beauty gaming tech launch vegan coffee skincare fashion music podcast running '
+         'outdoor budget luxury family pets kitchen finance crypto books art festival launch review unboxing').split()
+INDUSTRIES = 'retail food apparel electronics finance travel health media'.split()
+CATEGORIES = 'fitness beauty tech travel food gaming fashion finance music education'.split()
+NICHES = 'yoga skincare gadgets backpacking vegan esports streetwear investing indie coding'.split()
+FIRST = 'aarav priya rohan ananya vikram sneha arjun kavya rahul isha karan meera aditya neha'.split()
+LAST = 'sharma verma gupta iyer nair reddy kapoor mehta bose das singh khan joshi rao'.split()
+
+
+def skewed(rng, count, alpha=1.2):
+    #an index in range(count) where small indexes are picked far more often than large ones
+    return min(int(rng.paretovariate(alpha)) - 1, count - 1)
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def insert_chunks(db, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(db.insert(model), rows[start:start + CHUNK])
+
+
+def seed_database(db, models, sizes=None, seed=42):
+    """Fills an empty database and returns the sizes used. models maps 'User', 'Campaign' and 'AdRequest' to the model classes."""
+    sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+    User, Campaign, AdRequest = models['User'], models['Campaign'], models['AdRequest']
+    rng = random.Random(seed)
+    password = generate_password_hash(PASSWORD)
+
+    users = [dict(username='admin', name='Admin', email='admin@example.com', password=password, is_admin=True)]
+    users += [dict(username=f'sponsor{i}', name=f'Sponsor {i}', email=f'sponsor{i}@example.com', password=password,
+                   is_sponsor=True, sp_industry=rng.choice(INDUSTRIES), sp_budget=rng.randint(1000, 1000000))
+              for i in range(sizes['sponsors'])]
+    users += [dict(username=f'influencer{i}', name=f'{rng.choice(FIRST)} {rng.choice(LAST)}', email=f'influencer{i}@example.com',
+                   password=password, is_influencer=True, inf_category=rng.choice(CATEGORIES), inf_niche=rng.choice(NICHES),
+                   inf_reach=int(rng.paretovariate(1.1) * 1000))
+               for i in range(sizes['influencers'])]
+    insert_chunks(db, User, users)
+    sponsor_ids = db.session.execute(db.select(User.id).filter(User.is_sponsor == True).order_by(User.id)).scalars().all()
+    influencer_ids = db.session.execute(db.select(User.id).filter(User.is_influencer == True).order_by(User.id)).scalars().all()
+
+    today = date.today()
+    campaigns = []
+    for _ in range(sizes['campaigns']):
+        start = today - timedelta(days=rng.randint(0, 365))
+        campaigns.append(dict(name=words(rng, 3).title(), description=words(rng, 25), goals=words(rng, 8),
+                              start_date=start, end_date=start + timedelta(days=rng.randint(30, 400)),
+                              budget=rng.randint(500, 200000), visibility=rng.choice(('public', 'public', 'public', 'private')),
+                              status_camp=rng.choice(('ongoing',) * 6 + ('completed', 'completed', 'cancelled')),
+                              sponsor_id=sponsor_ids[skewed(rng, len(sponsor_ids))]))
+    insert_chunks(db, Campaign, campaigns)
+    campaign_ids = db.session.execute(db.select(Campaign.id).order_by(Campaign.id)).scalars().all()
+
+    ad_requests = []
+    #a campaign and influencer pair has one pending request at most, repeats of a pending pair are answered ones
+    pending = set()
+    for _ in range(sizes['ad_requests']):
+        created_by = rng.choice(('sponsor', 'sponsor', 'sponsor', 'influencer'))
+        row = dict(campaign_id=campaign_ids[skewed(rng, len(campaign_ids), 1.05)],
+                   influencer_id=influencer_ids[skewed(rng, len(influencer_ids), 1.05)],
+                   messages=words(rng, 10), requirements=words(rng, 6), payment_amount=rng.randint(50, 5000),
+                   created_by=created_by, status_adreq=rng.choice(('pending', 'pending', 'accepted', 'rejected')))
+        pair = (row['campaign_id'], row['influencer_id'])
+        if row['status_adreq'] == 'pending':
+            row['status_adreq'] = 'accepted' if pair in pending else 'pending'
+            pending.add(pair)
+        ad_requests.append(row)
+    insert_chunks(db, AdRequest, ad_requests)
+    db.session.commit()
+    return sizes
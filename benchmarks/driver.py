@@ -0,0 +1,292 @@
+"""Drives every route of main.py through the Flask test client and records latency, queries and bytes.
+
+Import this module only after IESCP_DATABASE_URL points at a scratch database, the app it drives
+uses whatever database that variable names. run() expects an app context with the schema set up.
+"""
+import gc
+import itertools
+import re
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from main import app, db, User, Campaign, AdRequest, Event, upgrade_db
+from benchmarks.datagen import PASSWORD
+
+#routes that are fine to answer with a redirect or a 304 to a revalidation, everything else must answer 200
+OK_STATUSES = (200, 302, 304)
+#routes that the driver leaves alone on purpose
+#the event stream is off by default and holds its connection for EVENTS_STREAM_SECONDS when on
+SKIPPED_ENDPOINTS = {'static', 'iescp.events_stream'}
+
+
+class Scenario:
+    def __init__(self, name, role, path, method='GET', data=None, json=None, setup=None, headers=None):
+        self.name = name
+        self.role = role
+        self.path = path
+        self.method = method
+        self.data = data
+        self.json = json
+        self.headers = headers
+        #setup(bench) runs before every request outside the timed section and returns the values for path/data
+        self.setup = setup
+
+    def endpoint(self):
+        path = self.path.split('?')[0].format(**{key: 1 for key in ('campaign_id', 'ad_request_id', 'influencer_id', 'user_id', 'n')})
+        return app.url_map.bind('localhost').match(path, self.method)[0]
+
+
+#statements whose query plan is checked, the rest (PRAGMA, BEGIN, ...) have none worth reading
+PLANNED = re.compile(r'\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b', re.IGNORECASE)
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        #every distinct statement the current scenario ran with the parameters it first ran with
+        self.statements = {}
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        if not executemany and statement not in self.statements and PLANNED.match(statement):
+            self.statements[statement] = parameters
+
+
+#tables read from end to end by any of the statements, found with EXPLAIN QUERY PLAN on the statements the route really ran
+#a SCAN step without an index (SEARCH, USING ... INDEX) on a real table is a full scan, subqueries and FTS5 lookups are not
+def full_scans(statements):
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        scans = set()
+        for statement, parameters in statements.items():
+            for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters):
+                step = re.match(r'SCAN (\w+)', row[-1])
+                if step and step.group(1) in tables and 'USING' not in row[-1] and 'VIRTUAL TABLE' not in row[-1]:
+                    scans.add(step.group(1))
+        return sorted(scans)
+    finally:
+        connection.close()
+
+
+def percentile(samples, pct):
+    #nearest rank, good enough for the few hundred samples a run collects
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError('Could not log in as %s' % username)
+
+
+class Bench:
+    """Holds the logged in clients and the ids the scenarios point at."""
+
+    def __init__(self):
+        self.serial = itertools.count()
+        self.sponsor_id = db.session.execute(db.select(User.id).filter_by(username='sponsor0')).scalar_one()
+        self.influencer_id = db.session.execute(db.select(User.id).filter_by(username='influencer0')).scalar_one()
+        #the busiest campaign of the sponsor, with the long tail of the generator this is the worst case page
+        self.campaign_id = db.session.execute(
+            db.select(Campaign.id).outerjoin(Campaign.ad_requests).filter(Campaign.sponsor_id == self.sponsor_id)
+            .group_by(Campaign.id).order_by(db.func.count(AdRequest.id).desc()).limit(1)).scalar_one()
+        self.ad_request_id = db.session.execute(
+            db.select(AdRequest.id).filter_by(campaign_id=self.campaign_id).limit(1)).scalar_one()
+        self.clients = {}
+        for role, username in (('admin', 'admin'), ('sponsor', 'sponsor0'), ('influencer', 'influencer0')):
+            self.clients[role] = app.test_client()
+            login(self.clients[role], username)
+        self.clients['anonymous'] = app.test_client()
+        self.etags = {}
+
+    def ids(self, **extra):
+        ids = dict(campaign_id=self.campaign_id, ad_request_id=self.ad_request_id, influencer_id=self.influencer_id,
+                   user_id=self.influencer_id, n=next(self.serial))
+        ids.update(extra)
+        return ids
+
+    def etag(self, role, path):
+        #the ETag a browser would hold after its first visit, fetched once per page
+        if (role, path) not in self.etags:
+            self.etags[role, path] = self.clients[role].get(path).headers['ETag']
+        return self.etags[role, path]
+
+    def event_cursor(self, user_id):
+        #the cursor a dashboard polling right now would hold, so the poll finds nothing new like most polls do
+        return db.session.execute(db.select(db.func.max(Event.id)).filter_by(user_id=user_id)).scalar() or 0
+
+    def new_campaign(self):
+        campaign = Campaign(name='Bench campaign', description='throwaway', end_date=date.today() + timedelta(days=30),
+                            budget=1000, sponsor_id=self.sponsor_id)
+        db.session.add(campaign)
+        db.session.commit()
+        return campaign.id
+
+    def expire_pending(self, campaign_id=None):
+        #a campaign and influencer have one pending ad request at most, so the one a scenario sends or answers must be the only one
+        db.session.execute(db.update(AdRequest).filter_by(campaign_id=campaign_id or self.campaign_id, influencer_id=self.influencer_id, status_adreq='pending')
+                           .values(status_adreq='expired'))
+        db.session.commit()
+
+    def new_ad_request(self, created_by='sponsor', campaign_id=None):
+        self.expire_pending(campaign_id)
+        ad_request = AdRequest(campaign_id=campaign_id or self.campaign_id, influencer_id=self.influencer_id, requirements='throwaway',
+                               payment_amount=100, created_by=created_by)
+        db.session.add(ad_request)
+        db.session.commit()
+        return ad_request.id
+
+
+def scenarios():
+    campaign_form = {'name': 'Bench', 'description': 'bench run', 'deadline': (date.today() + timedelta(days=60)).isoformat(),
+                     'budget': '5000', 'visibility': 'public', 'goals': 'reach'}
+    ad_request_form = {'messages': 'hello', 'requirements': 'one post', 'payment_amount': '250'}
+    return [
+        Scenario('home', 'anonymous', '/'),
+        Scenario('register_form', 'anonymous', '/register/influencer'),
+        Scenario('register', 'anonymous', '/register/influencer', 'POST',
+                 data={'name': 'Bench {n}', 'username': 'bench{n}', 'email': 'bench{n}@example.com', 'password': PASSWORD,
+                       'inf_category': 'tech', 'inf_niche': 'coding', 'inf_reach': '1000'}),
+        Scenario('login_form', 'anonymous', '/login'),
+        Scenario('login', 'anonymous', '/login', 'POST', data={'username': 'influencer1', 'password': PASSWORD}),
+        Scenario('logout', 'anonymous', '/logout', setup=lambda bench: login(bench.clients['anonymous'], 'influencer1') or bench.ids()),
+        Scenario('admin_dashboard', 'admin', '/admin/dashboard'),
+        Scenario('admin_dashboard_last_pages', 'admin', '/admin/dashboard?users_page=100&campaigns_page=40&ad_reqs_page=400'),
+        Scenario('admin_export_users', 'admin', '/admin/export/users.csv'),
+        Scenario('admin_export_ad_requests', 'admin', '/admin/export/ad_requests.ndjson'),
+        Scenario('admin_cache_stats', 'admin', '/admin/cache_stats'),
+        Scenario('metrics', 'anonymous', '/metrics'),
+        Scenario('api_campaign', 'admin', '/api/campaigns/{campaign_id}'),
+        Scenario('api_user', 'admin', '/api/users/{user_id}'),
+        Scenario('api_ad_request', 'admin', '/api/adrequests/{ad_request_id}'),
+        Scenario('sponsor_dashboard', 'sponsor', '/sponsor/dashboard'),
+        Scenario('sponsor_campaigns', 'sponsor', '/sponsor/campaigns'),
+        Scenario('sponsor_campaign', 'sponsor', '/sponsor/campaigns/{campaign_id}'),
+        Scenario('sponsor_campaign_revalidate', 'sponsor', '/sponsor/campaigns/{campaign_id}', headers={'If-None-Match': '{etag}'},
+                 setup=lambda bench: bench.ids(etag=bench.etag('sponsor', '/sponsor/campaigns/%d' % bench.campaign_id))),
+        Scenario('sponsor_dashboard_gzip', 'sponsor', '/sponsor/dashboard', headers={'Accept-Encoding': 'gzip'}),
+        Scenario('sponsor_events_poll', 'sponsor', '/events?after={cursor}', setup=lambda bench: bench.ids(cursor=bench.event_cursor(bench.sponsor_id))),
+        Scenario('influencer_events_backlog', 'influencer', '/events?after=0'),
+        Scenario('create_campaign_form', 'sponsor', '/sponsor/create_campaign'),
+        Scenario('create_campaign', 'sponsor', '/sponsor/create_campaign', 'POST', data=campaign_form),
+        Scenario('campaign_edit_form', 'sponsor', '/sponsor/campaigns/{campaign_id}/edit'),
+        Scenario('campaign_edit', 'sponsor', '/sponsor/campaigns/{campaign_id}/edit', 'POST',
+                 setup=lambda bench: bench.ids(campaign_id=bench.new_campaign()), data=campaign_form),
+        Scenario('campaign_delete', 'sponsor', '/sponsor/campaigns/{campaign_id}/delete',
+                 setup=lambda bench: bench.ids(campaign_id=bench.new_campaign())),
+        Scenario('create_adrequest_form', 'sponsor', '/sponsor/campaigns/{campaign_id}/create_adrequest'),
+        Scenario('create_adrequest', 'sponsor', '/sponsor/campaigns/{campaign_id}/create_adrequest', 'POST',
+                 setup=lambda bench: bench.expire_pending() or bench.ids(), data=dict(ad_request_form, influencer_id='{influencer_id}')),
+        Scenario('bulk_adrequest_form', 'sponsor', '/sponsor/campaigns/{campaign_id}/bulk_adrequest'),
+        Scenario('bulk_adrequest', 'sponsor', '/sponsor/campaigns/{campaign_id}/bulk_adrequest', 'POST',
+                 setup=lambda bench: bench.ids(campaign_id=bench.new_campaign()),
+                 json={'filters': {'category': 'tech'}, 'requirements': 'one post', 'payment_amount': 100}),
+        Scenario('sponsor_adrequests', 'sponsor', '/sponsor/campaigns/{campaign_id}/adrequests'),
+        Scenario('campaign_recommendations', 'sponsor', '/sponsor/campaigns/{campaign_id}/recommendations'),
+        Scenario('adrequest_edit_form', 'sponsor', '/sponsor/campaigns/{campaign_id}/adrequests/{ad_request_id}/edit'),
+        Scenario('adrequest_edit', 'sponsor', '/sponsor/campaigns/{campaign_id}/adrequests/{ad_request_id}/edit', 'POST',
+                 setup=lambda bench: bench.ids(ad_request_id=bench.new_ad_request()), data=ad_request_form),
+        Scenario('adrequest_delete', 'sponsor', '/sponsor/campaigns/{campaign_id}/adrequests/{ad_request_id}/delete',
+                 setup=lambda bench: bench.ids(ad_request_id=bench.new_ad_request())),
+        Scenario('adrequest_accept_by_sponsor', 'sponsor', '/adrequests/{ad_request_id}/accept', 'POST',
+                 setup=lambda bench: bench.ids(ad_request_id=bench.new_ad_request('influencer'))),
+        Scenario('view_influencers', 'sponsor', '/sponsor/influencers'),
+        Scenario('view_influencers_search', 'sponsor', '/sponsor/influencers?search_query=sha&category=tech&reach_min=1000'),
+        Scenario('influencer_typeahead', 'sponsor', '/sponsor/influencers/typeahead?q=pri'),
+        Scenario('influencer_profile', 'sponsor', '/sponsor/influencers/{influencer_id}'),
+        Scenario('influencer_dashboard', 'influencer', '/influencer/dashboard'),
+        Scenario('influencer_campaigns', 'influencer', '/influencer/campaigns'),
+        Scenario('influencer_campaigns_search', 'influencer', '/influencer/campaigns?search_query=fitness+travel'),
+        Scenario('influencer_campaign', 'influencer', '/influencer/campaigns/{campaign_id}'),
+        Scenario('influencer_adrequests', 'influencer', '/influencer/campaigns/{campaign_id}/adrequests'),
+        Scenario('send_ad_request_form', 'influencer', '/influencer/send_ad_request/{campaign_id}'),
+        Scenario('send_ad_request', 'influencer', '/influencer/send_ad_request/{campaign_id}', 'POST',
+                 setup=lambda bench: bench.expire_pending() or bench.ids(), data=ad_request_form),
+        Scenario('adrequest_accept', 'influencer', '/adrequests/{ad_request_id}/accept', 'POST',
+                 setup=lambda bench: bench.ids(ad_request_id=bench.new_ad_request())),
+        Scenario('adrequest_reject', 'influencer', '/adrequests/{ad_request_id}/reject', 'POST',
+                 setup=lambda bench: bench.ids(ad_request_id=bench.new_ad_request())),
+        Scenario('adrequests_bulk', 'influencer', '/adrequests/bulk', 'POST',
+                 setup=lambda bench: bench.ids(ad_request_ids=[bench.new_ad_request(campaign_id=bench.new_campaign()) for _ in range(20)]),
+                 json={'action': 'accept', 'ad_request_ids': '{ad_request_ids}'}),
+    ]
+
+
+def fill(value, ids):
+    #formats the {placeholders} of a form or JSON body, a placeholder standing alone keeps the type of its value
+    if isinstance(value, dict):
+        return {key: fill(item, ids) for key, item in value.items()}
+    if isinstance(value, str) and value.startswith('{') and value.endswith('}') and value[1:-1] in ids:
+        return ids[value[1:-1]]
+    if isinstance(value, str):
+        return value.format(**ids)
+    return value
+
+
+def run_scenario(bench, counter, scenario, iterations, warmup):
+    client = bench.clients[scenario.role]
+    latencies, queries, sizes, bad = [], [], [], []
+    counter.statements = {}
+    for i in range(warmup + iterations):
+        ids = scenario.setup(bench) if scenario.setup else bench.ids()
+        path = scenario.path.format(**ids)
+        kwargs = {}
+        if scenario.data is not None:
+            kwargs['data'] = fill(scenario.data, ids)
+        if scenario.json is not None:
+            kwargs['json'] = fill(scenario.json, ids)
+        if scenario.headers is not None:
+            kwargs['headers'] = fill(scenario.headers, ids)
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(path, method=scenario.method, **kwargs)
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code not in OK_STATUSES:
+            bad.append(response.status_code)
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(counter.count)
+        sizes.append(len(body))
+    return {
+        'endpoint': scenario.endpoint(),
+        'method': scenario.method,
+        'role': scenario.role,
+        'samples': len(latencies),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries': percentile(queries, 50),
+        'max_queries': max(queries),
+        'bytes': percentile(sizes, 50),
+        'errors': sorted(set(bad)),
+        'scans': full_scans(counter.statements),
+    }
+
+
+def run(iterations=30, warmup=3, only=None, log=print):
+    counter = QueryCounter(db.engine)
+    bench = Bench()
+    #the seeded rows and warm caches make every full collection walk a large heap, a pause of tens of ms that lands
+    #on whichever sample triggers it; frozen objects are never scanned again, so only the route's own garbage is
+    gc.collect()
+    gc.freeze()
+    results = {}
+    for scenario in scenarios():
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = result = run_scenario(bench, counter, scenario, iterations, warmup)
+        log('%-30s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %3d queries  %8d bytes%s%s' % (
+            scenario.name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries'], result['bytes'],
+            '  SCANS %s' % ', '.join(result['scans']) if result['scans'] else '',
+            '  ERRORS %s' % result['errors'] if result['errors'] else ''))
+    covered = {scenario.endpoint() for scenario in scenarios()}
+    uncovered = sorted(set(app.view_functions) - covered - SKIPPED_ENDPOINTS)
+    return results, uncovered
@@ -0,0 +1,65 @@
+"""Times the influencer directory search: text, typo, facet and reach filters.
+
+Usage: python benchmarks/influencer_search.py [number_of_influencers]
+
+Runs against a throwaway database, never the one next to main.py.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + DB_PATH
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import app, db, User, search_influencers, influencer_facet_counts, upgrade_db  # noqa: E402
+
+FIRST = 'aarav priya rohan ananya vikram sneha arjun kavya rahul isha karan meera aditya neha'.split()
+LAST = 'sharma verma gupta iyer nair reddy kapoor mehta bose das singh khan joshi rao'.split()
+CATEGORIES = 'fitness beauty tech travel food gaming fashion finance music education'.split()
+NICHES = 'yoga skincare gadgets backpacking vegan esports streetwear investing indie coding'.split()
+SEARCHES = [dict(search_query='priya'), dict(search_query='priay sharma'), dict(search_query='fit'),
+            dict(search_query='kapoor', category='fitness'), dict(reach_min=100000, reach_max=200000),
+            dict(category='tech', niche='gadgets')]
+RUNS = 3
+
+
+def seed(count):
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        rows.append(dict(username=f'inf{i}', name=f'{rng.choice(FIRST)} {rng.choice(LAST)}', email=f'inf{i}@example.com',
+                         password='x', is_influencer=True, inf_category=rng.choice(CATEGORIES),
+                         inf_niche=rng.choice(NICHES), inf_reach=int(rng.paretovariate(1.2) * 1000)))
+    db.session.execute(db.insert(User), rows)
+    db.session.commit()
+
+
+def run(filters):
+    page = db.paginate(search_influencers(**filters), page=1, per_page=app.config['INFLUENCERS_PAGE_SIZE'])
+    influencer_facet_counts(User.inf_category, search_influencers(skip_category=True, **filters))
+    influencer_facet_counts(User.inf_niche, search_influencers(skip_niche=True, **filters))
+    return page.total
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with app.app_context():
+        upgrade_db()
+        start = time.perf_counter()
+        seed(count)
+        print(f'seeded {count} influencers in {time.perf_counter() - start:.1f}s ({DB_PATH})')
+        for filters in SEARCHES:
+            best = None
+            for _ in range(RUNS):
+                start = time.perf_counter()
+                total = run(filters)
+                elapsed = (time.perf_counter() - start) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            print(f'{str(filters):<60}{best:>10.1f} ms{total:>9} matches')
+
+
+if __name__ == '__main__':
+    main()
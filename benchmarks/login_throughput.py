@@ -0,0 +1,77 @@
+"""Measures login throughput and how a page other than login responds during a login storm.
+
+Usage: python benchmarks/login_throughput.py [seconds] [login threads]
+
+A sponsor keeps loading its campaigns page, first alone and then while the login threads post
+the login form as fast as they can. Passwords are verified on the pool sized by
+IESCP_PASSWORD_WORKERS with the method in IESCP_PASSWORD_METHOD, so both can be compared by
+setting them on the command line. Runs against a throwaway database, never the one next to main.py.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import PASSWORD, seed_database  # noqa: E402
+from main import app, db, upgrade_db, password_hasher, User, Campaign, AdRequest  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+def load_page(deadline, timings):
+    client = app.test_client()
+    client.post('/login', data={'username': 'sponsor0', 'password': PASSWORD})
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        client.get('/sponsor/campaigns')
+        timings.append(time.perf_counter() - started)
+
+
+def log_in(deadline, number, timings, statuses):
+    client = app.test_client()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.post('/login', data={'username': f'influencer{number}', 'password': PASSWORD})
+        timings.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        client.get('/logout')
+
+
+def main():
+    seconds, threads = (sys.argv[1:] + ['5', '16'][len(sys.argv) - 1:])[:2]
+    seconds, threads = float(seconds), int(threads)
+    with app.app_context():
+        upgrade_db()
+        seed_database(db, {'User': User, 'Campaign': Campaign, 'AdRequest': AdRequest},
+                      {'sponsors': 20, 'influencers': threads, 'campaigns': 200, 'ad_requests': 1000})
+        hasher = password_hasher()
+    print(f'{hasher.method}, {hasher.workers} hashing threads, {threads} login threads, {seconds:g}s per phase')
+
+    idle = []
+    load_page(time.perf_counter() + seconds, idle)
+
+    page, logins, statuses = [], [], {}
+    deadline = time.perf_counter() + seconds
+    workers = [threading.Thread(target=log_in, args=(deadline, number, logins, statuses)) for number in range(threads)]
+    workers.append(threading.Thread(target=load_page, args=(deadline, page)))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    print(f'{"":<22}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for name, timings in (('campaigns page idle', idle), ('campaigns page storm', page), ('login', logins)):
+        print(f'{name:<22}{len(timings):>8}{percentile(timings, 0.5):>10.1f}{percentile(timings, 0.95):>10.1f}{percentile(timings, 0.99):>10.1f}')
+    print(f'logins/s {len(logins) / seconds:.1f}, statuses {dict(sorted(statuses.items()))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Times the influencer recommendations: building the feature matrix, refreshing it after changes and ranking.
+
+Usage: python benchmarks/recommendations.py [number_of_influencers]
+
+Runs against a throwaway database, never the one next to main.py.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+os.environ['IESCP_DATABASE_URL'] = 'sqlite:///' + DB_PATH
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import app, db, User, AdRequest, Campaign, upgrade_db, recommender  # noqa: E402
+from benchmarks.datagen import CATEGORIES, NICHES, WORDS, insert_chunks  # noqa: E402
+from datetime import date  # noqa: E402
+
+RUNS = 20
+CHANGES = 1000
+
+
+def seed(count, rng):
+    insert_chunks(db, User, [dict(username='sponsor', name='Sponsor', email='sponsor@example.com', password='x', is_sponsor=True)])
+    insert_chunks(db, User, [dict(username=f'inf{i}', name=f'Influencer {i}', email=f'inf{i}@example.com', password='x', is_influencer=True,
+                                  inf_category=rng.choice(CATEGORIES), inf_niche=rng.choice(NICHES), inf_reach=int(rng.paretovariate(1.1) * 1000))
+                             for i in range(count)])
+    insert_chunks(db, Campaign, [dict(name='Campaign', description='history', end_date=date(2030, 1, 1), budget=1000, sponsor_id=1)])
+    insert_chunks(db, AdRequest, [dict(campaign_id=1, influencer_id=rng.randint(2, count + 1), requirements='post', payment_amount=10,
+                                       status_adreq=rng.choice(('accepted', 'rejected'))) for _ in range(count // 2)])
+    db.session.commit()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rng = random.Random(42)
+    with app.app_context():
+        upgrade_db()
+        start = time.perf_counter()
+        seed(count, rng)
+        print(f'seeded {count} influencers in {time.perf_counter() - start:.1f}s ({DB_PATH})')
+        build_ms, engine = timed(recommender)
+        print(f'full build of the feature matrix: {build_ms:.0f}ms for {len(engine)} influencers')
+        samples = []
+        for _ in range(RUNS):
+            text = ' '.join(rng.choice(WORDS + CATEGORIES + NICHES) for _ in range(20))
+            ms, ranked = timed(lambda: engine.recommend(text, rng.randint(500, 200000), limit=50))
+            samples.append(ms)
+        print(f'top 50 of {len(engine)}: median {statistics.median(samples):.1f}ms, max {max(samples):.1f}ms')
+        for influencer_id in rng.sample(range(2, count + 2), CHANGES):
+            db.session.execute(db.update(User).where(User.id == influencer_id).values(inf_reach=rng.randint(100, 100000)))
+        db.session.commit()
+        refresh_ms, _ = timed(recommender)
+        print(f'incremental refresh after {CHANGES} profile changes: {refresh_ms:.0f}ms')
+        idle_ms, _ = timed(recommender)
+        print(f'refresh with nothing changed: {idle_ms:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
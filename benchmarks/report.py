@@ -0,0 +1,64 @@
+"""Compares a benchmark run with a stored baseline and lists the routes that got worse."""
+import json
+
+#metrics compared by default, latency can be left out on CI runners that differ from the machine the baseline came from
+METRICS = ('latency', 'queries', 'bytes', 'plans')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path, report):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(baseline, current, tolerance=0.25, latency_tolerance=0.5, min_ms=5.0, metrics=METRICS, partial=False):
+    """Returns a list of (route, message) for every regression, an empty list means the run passed.
+
+    Latency regresses when p50 grows by more than latency_tolerance and by more than min_ms, which keeps
+    fast routes from failing on timer noise; p95 of a few dozen samples follows single pauses and is only
+    reported. Queries regress on any increase, bytes on more than tolerance, plans on a full table scan the
+    baseline did not have (listings that page over a whole table are in the baseline). A partial run (--only) is
+    compared on the routes it ran, a full run also fails on routes missing from it.
+    """
+    problems = []
+    if baseline['meta']['sizes'] != current['meta']['sizes'] or baseline['meta']['seed'] != current['meta']['seed']:
+        return [('*', 'baseline was recorded with sizes %s seed %s, this run used sizes %s seed %s' % (
+            baseline['meta']['sizes'], baseline['meta']['seed'], current['meta']['sizes'], current['meta']['seed']))]
+    for name, base in sorted(baseline['routes'].items()):
+        now = current['routes'].get(name)
+        if now is None:
+            if not partial:
+                problems.append((name, 'missing from this run'))
+            continue
+        if now['errors']:
+            problems.append((name, 'answered with status %s' % now['errors']))
+        if 'latency' in metrics and now['p50_ms'] > base['p50_ms'] * (1 + latency_tolerance) and now['p50_ms'] - base['p50_ms'] > min_ms:
+            problems.append((name, 'p50 %.2fms -> %.2fms' % (base['p50_ms'], now['p50_ms'])))
+        if 'queries' in metrics and now['queries'] > base['queries']:
+            problems.append((name, 'queries %d -> %d' % (base['queries'], now['queries'])))
+        if 'bytes' in metrics and now['bytes'] > base['bytes'] * (1 + tolerance):
+            problems.append((name, 'bytes %d -> %d' % (base['bytes'], now['bytes'])))
+        new_scans = sorted(set(now['scans']) - set(base.get('scans', [])))
+        if 'plans' in metrics and new_scans:
+            problems.append((name, 'full scan of %s' % ', '.join(new_scans)))
+    return problems
+
+
+def summary(baseline, current):
+    #one line per route with the p50, p95 and query changes, printed before the verdict
+    lines = []
+    for name, now in sorted(current['routes'].items()):
+        base = baseline['routes'].get(name)
+        if base is None:
+            lines.append('%-30s new route' % name)
+            continue
+        change = (now['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100 if base['p50_ms'] else 0
+        lines.append('%-30s p50 %8.2fms -> %8.2fms (%+6.1f%%)  p95 %8.2fms -> %8.2fms  queries %3d -> %3d  bytes %8d -> %8d' % (
+            name, base['p50_ms'], now['p50_ms'], change, base['p95_ms'], now['p95_ms'], base['queries'], now['queries'],
+            base['bytes'], now['bytes']))
+    return lines
@@ -0,0 +1,58 @@
+"""Measures how long a fresh worker process takes to become ready.
+
+Usage: python benchmarks/startup.py [runs]
+
+Every run is a new interpreter, like a freshly forked worker without preloading. It times importing
+main (which builds the default app), building one more app with create_app, answering the first
+request, and for comparison the schema check every worker ran at import before the app factory.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STEPS = ['import main', 'create_app()', 'first request', 'upgrade_db() on current schema']
+
+
+def child():
+    import time
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import main
+    timings = [time.perf_counter() - started]
+    started = time.perf_counter()
+    app = main.create_app()
+    timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    app.test_client().get('/login')
+    timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    with app.app_context():
+        main.upgrade_db()
+    timings.append(time.perf_counter() - started)
+    print(json.dumps(timings))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    env = dict(os.environ, IESCP_DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3'))
+    #the first run creates the schema, so it is left out of the numbers
+    subprocess.run([sys.executable, __file__, '--child'], env=env, check=True, capture_output=True)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, __file__, '--child'], env=env, check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    print(f'{"step":<34}{"median ms":>10}{"max ms":>10}')
+    for i, step in enumerate(STEPS):
+        values = [sample[i] * 1000 for sample in samples]
+        print(f'{step:<34}{statistics.median(values):>10.1f}{max(values):>10.1f}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--child']:
+        child()
+    else:
+        main()
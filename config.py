@@ -0,0 +1,139 @@
+import os
+
+
+curr_dir=os.path.abspath(os.path.dirname(__file__))
+
+
+#settings shared by every environment, pick one of the classes below with IESCP_CONFIG or pass it to create_app
+class Config:
+    SECRET_KEY=os.environ.get('IESCP_SECRET_KEY', 'letsencrypt')
+
+    #adding the database
+    SQLALCHEMY_DATABASE_URI=os.environ.get('IESCP_DATABASE_URL', 'sqlite:///'+os.path.join(curr_dir,'iescp.sqlite3'))
+    SQLALCHEMY_TRACK_MODIFICATIONS=False
+
+    #connection pool per worker process, dropped by create_app for in-memory SQLite which keeps one connection per thread
+    #no pre-ping: a SQLite file connection does not go stale like a server connection, the ping would only add a query per checkout
+    SQLALCHEMY_ENGINE_OPTIONS={
+        'pool_size': int(os.environ.get('IESCP_DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('IESCP_DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('IESCP_DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('IESCP_DB_POOL_RECYCLE', 1800)),
+    }
+
+    #pragmas run on every new SQLite connection, set IESCP_SQLITE_TUNING=0 to get SQLite's defaults back
+    #WAL lets readers carry on while one worker writes and busy_timeout makes writers queue instead of failing with "database is locked"
+    SQLITE_PRAGMAS={
+        'journal_mode': 'WAL',
+        'busy_timeout': int(os.environ.get('IESCP_SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'synchronous': 'NORMAL',
+        'cache_size': -int(os.environ.get('IESCP_SQLITE_CACHE_SIZE_KB', 20000)),
+        'mmap_size': int(os.environ.get('IESCP_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': 'MEMORY',
+    } if os.environ.get('IESCP_SQLITE_TUNING', '1') != '0' else {}
+
+    #per-user dashboard cache, in-process unless IESCP_CACHE_URL points at a shared Redis; entries are checked against the user's newest event on every read
+    CACHE_URL=os.environ.get('IESCP_CACHE_URL')
+    CACHE_TTL=int(os.environ.get('IESCP_CACHE_TTL', 60))
+    CACHE_MAX_ENTRIES=int(os.environ.get('IESCP_CACHE_MAX_ENTRIES', 10000))
+
+    #number of rows shown per table on the admin dashboard
+    ADMIN_PAGE_SIZE=25
+    #number of campaign cards shown per page on the influencer campaigns page
+    CAMPAIGNS_PAGE_SIZE=24
+    #number of influencer cards shown per page on the influencer directory
+    INFLUENCERS_PAGE_SIZE=24
+    #share of a search word's trigrams that must match as one run, lower forgives more typos in short words but matches more influencers
+    SEARCH_TRIGRAM_SHARE=float(os.environ.get('IESCP_SEARCH_TRIGRAM_SHARE', 0.3))
+    #matches the directory's category and niche counts are taken from, a broader search shows them as lower bounds
+    FACET_SCAN_MAX=int(os.environ.get('IESCP_FACET_SCAN_MAX', 2000))
+    #most suggestions the influencer typeahead returns
+    TYPEAHEAD_LIMIT=10
+    #most influencers a single bulk ad request can be sent to
+    BULK_ADREQUEST_MAX=20000
+    #sponsors listed in the admin statistics panel, largest total budget first
+    STATS_TOP_SPONSORS=10
+    #rows fetched from the database per chunk while streaming an export
+    EXPORT_CHUNK_SIZE=1000
+
+    #per-route query count, SQL time, template time and response size exposed on /metrics, set IESCP_METRICS=0 to switch it off
+    METRICS_ENABLED=os.environ.get('IESCP_METRICS', '1') != '0'
+    #statements slower than this many milliseconds are logged together with the route that ran them
+    SLOW_QUERY_MS=float(os.environ.get('IESCP_SLOW_QUERY_MS', 100))
+    #adds a Server-Timing header with the SQL, template and total time of each response, shown by browser dev tools
+    SERVER_TIMING=os.environ.get('IESCP_SERVER_TIMING', '0') == '1'
+    #most queries one request may run, 0 turns the check off; QUERY_BUDGETS overrides it per endpoint
+    QUERY_BUDGET=int(os.environ.get('IESCP_QUERY_BUDGET', 0))
+    QUERY_BUDGETS={}
+    #strict budgets fail the request with QueryBudgetExceeded instead of logging a warning, meant for tests and benchmarks
+    QUERY_BUDGET_STRICT=os.environ.get('IESCP_QUERY_BUDGET_STRICT', '0') == '1'
+
+    #campaigns or ad requests changed per transaction by the lifecycle job
+    LIFECYCLE_BATCH_SIZE=int(os.environ.get('IESCP_LIFECYCLE_BATCH_SIZE', 500))
+    #seconds between lifecycle runs inside each worker, 0 leaves it to the run-lifecycle command (e.g. from cron)
+    LIFECYCLE_INTERVAL=int(os.environ.get('IESCP_LIFECYCLE_INTERVAL', 0))
+    #ad requests a campaign may have and still be deleted by the request itself, larger ones are hidden at once and purged in LIFECYCLE_BATCH_SIZE batches
+    PURGE_INLINE_MAX=int(os.environ.get('IESCP_PURGE_INLINE_MAX', 1000))
+    #pause between purge batches that lets writers waiting on the lock in
+    PURGE_PAUSE_MS=int(os.environ.get('IESCP_PURGE_PAUSE_MS', 5))
+
+    #influencers listed on a campaign's recommendations page
+    RECOMMEND_LIMIT=50
+    #weight of each part of the recommendation score, every part is between 0 and 1
+    RECOMMEND_WEIGHTS={'category': 3.0, 'niche': 2.0, 'reach': 1.5, 'acceptance': 1.0}
+    #followers one unit of campaign budget is expected to buy, influencers near budget * this reach score best
+    RECOMMEND_REACH_PER_BUDGET=float(os.environ.get('IESCP_RECOMMEND_REACH_PER_BUDGET', 10))
+    #rows of the feature change log kept by the lifecycle job, a worker further behind reloads its whole matrix
+    RECOMMEND_CHANGES_KEEP=100000
+
+    #HTML and JSON responses at least this large are gzipped for clients sending Accept-Encoding: gzip, 0 turns compression off
+    COMPRESS_MIN_BYTES=int(os.environ.get('IESCP_COMPRESS_MIN_BYTES', 1024))
+    COMPRESS_LEVEL=int(os.environ.get('IESCP_COMPRESS_LEVEL', 6))
+    COMPRESS_MIMETYPES=('text/html', 'application/json', 'text/plain')
+
+    #most events one request to /events returns, a client further behind asks again from the last one
+    EVENTS_PAGE_SIZE=100
+    #days of events kept by the lifecycle job, a dashboard open longer than that reloads itself
+    EVENTS_KEEP_DAYS=int(os.environ.get('IESCP_EVENTS_KEEP_DAYS', 7))
+    #seconds between two looks at the event log, by the dashboards polling /events and by each open event stream
+    EVENTS_POLL_SECONDS=int(os.environ.get('IESCP_EVENTS_POLL_SECONDS', 5))
+    #seconds an /events/stream connection stays open before the browser reconnects, 0 switches Server-Sent Events off and dashboards poll
+    EVENTS_STREAM_SECONDS=int(os.environ.get('IESCP_EVENTS_STREAM_SECONDS', 0))
+
+    #werkzeug hash method with its cost, e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000; passwords stored with other parameters are rehashed on the next login
+    PASSWORD_METHOD=os.environ.get('IESCP_PASSWORD_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_SALT_LENGTH=16
+    #threads per worker that hash passwords, 0 uses half the CPU cores
+    PASSWORD_WORKERS=int(os.environ.get('IESCP_PASSWORD_WORKERS', 0))
+    #passwords allowed to wait for a hashing thread, past that login and register answer 503 so a login storm cannot queue without end
+    PASSWORD_QUEUE_MAX=int(os.environ.get('IESCP_PASSWORD_QUEUE_MAX', 64))
+
+    #rows the import-data command inserts per transaction
+    IMPORT_BATCH_SIZE=int(os.environ.get('IESCP_IMPORT_BATCH_SIZE', 5000))
+    #processes hashing the passwords of imported users with PASSWORD_METHOD, 0 uses every CPU core
+    IMPORT_WORKERS=int(os.environ.get('IESCP_IMPORT_WORKERS', 0))
+
+
+class ProductionConfig(Config):
+    pass
+
+
+class DevelopmentConfig(Config):
+    DEBUG=True
+
+
+#a private in-memory database per app, so every test can build its own app with create_app(TestingConfig)
+class TestingConfig(Config):
+    TESTING=True
+    SQLALCHEMY_DATABASE_URI='sqlite://'
+    SQLITE_PRAGMAS={}
+    QUERY_BUDGET_STRICT=True
+    #cheap hashes keep tests that register and log in many users fast
+    PASSWORD_METHOD='pbkdf2:sha256:1000'
+
+
+CONFIGS={
+    'production': ProductionConfig,
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+}
@@ -0,0 +1,280 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+
+
+#what the import command can create, user kinds map to the role flag they set
+USER_KINDS = {'sponsors': 'is_sponsor', 'influencers': 'is_influencer'}
+KINDS = tuple(USER_KINDS) + ('campaigns',)
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+#passwords sent to a hashing process at once, large enough that pickling them costs little next to the hashing
+HASH_CHUNK = 250
+#record fields the error report masks, a rejected row must not leave a plaintext password on disk
+SECRET_FIELDS = ('password',)
+
+
+#a row that cannot be imported, its message goes to the error report
+class RowError(ValueError):
+    pass
+
+
+#runs in the pool's processes, so the KDF of a large import uses every core instead of one
+def hash_passwords(method, salt_length, passwords):
+    return [generate_password_hash(password, method, salt_length) for password in passwords]
+
+
+#the record as the error report shows it, JSON with its secret fields masked
+def report_record(record):
+    if isinstance(record, RowError):
+        return ''
+    return json.dumps({key: '***' if key in SECRET_FIELDS and value else value for key, value in record.items()}, default=str)
+
+
+#yields (row number, record) for each data row of a CSV or NDJSON file, one line at a time, row numbers start at 1
+#a line that is not a JSON object yields a RowError in place of its record
+def read_records(path, file_format):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if file_format == 'csv':
+            yield from enumerate(csv.DictReader(f), 1)
+            return
+        number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = RowError('not valid JSON: %s' % e)
+            if not isinstance(record, (dict, RowError)):
+                record = RowError('not a JSON object')
+            yield number, record
+
+
+def text_field(record, table, name, required=True):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise RowError('%s is required' % name)
+        return None
+    length = getattr(table.c[name].type, 'length', None)
+    if length and len(value) > length:
+        raise RowError('%s is longer than %d characters' % (name, length))
+    return value
+
+
+def int_field(record, name, required=False):
+    value = record.get(name)
+    if value is None or str(value).strip() == '':
+        if required:
+            raise RowError('%s is required' % name)
+        return None
+    try:
+        value = int(str(value).strip())
+    except ValueError:
+        raise RowError('%s is not a whole number' % name)
+    if value < 0:
+        raise RowError('%s is negative' % name)
+    return value
+
+
+def date_field(record, name, default=None):
+    value = str(record.get(name) or '').strip()
+    if not value:
+        if default is None:
+            raise RowError('%s is required' % name)
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError('%s is not a YYYY-MM-DD date' % name)
+
+
+#the users row for a sponsor or influencer record and its plain password, the same fields register() takes
+def user_row(record, table, flag):
+    row = {'username': text_field(record, table, 'username'), 'name': text_field(record, table, 'name'),
+           'email': text_field(record, table, 'email'), flag: True}
+    if '@' not in row['email']:
+        raise RowError('email is not an email address')
+    password = str(record.get('password') or '')
+    if not password:
+        raise RowError('password is required')
+    if flag == 'is_sponsor':
+        row.update(sp_industry=text_field(record, table, 'sp_industry', required=False), sp_budget=int_field(record, 'sp_budget'))
+    else:
+        row.update(inf_category=text_field(record, table, 'inf_category', required=False),
+                   inf_niche=text_field(record, table, 'inf_niche', required=False), inf_reach=int_field(record, 'inf_reach'))
+    return row, password
+
+
+#the campaigns row for a record, its sponsor is named by username and resolved for the whole batch later
+def campaign_row(record, table):
+    row = {'name': text_field(record, table, 'name'), 'description': text_field(record, table, 'description'),
+           'goals': text_field(record, table, 'goals', required=False), 'budget': int_field(record, 'budget', required=True),
+           'visibility': (text_field(record, table, 'visibility', required=False) or 'public').lower(),
+           'start_date': date_field(record, 'start_date', default=date.today()), 'end_date': date_field(record, 'end_date'),
+           'status_camp': 'ongoing'}
+    if row['visibility'] not in ('public', 'private'):
+        raise RowError('visibility must be public or private')
+    if row['end_date'] < row['start_date']:
+        raise RowError('end_date is before start_date')
+    sponsor = str(record.get('sponsor') or '').strip()
+    if not sponsor:
+        raise RowError('sponsor is required')
+    return row, sponsor
+
+
+#imports one file of sponsors, influencers or campaigns in batches of batch_size rows, each batch in one transaction
+#usernames and emails are checked against the file so far and, with one IN query per batch, against the database
+#passwords are hashed on a process pool while the previous batch is inserted
+#the checkpoint row is updated in each batch's transaction, so a run that stopped resumes after the last batch it committed
+#rejected rows are appended to a CSV error report with their row number and reason
+class BulkImporter:
+    def __init__(self, db, models, kind, path, file_format=None, batch_size=5000, workers=0, password_method='scrypt',
+                 salt_length=16, checkpoint=None, errors_path=None, on_batch=None):
+        if kind not in KINDS:
+            raise ValueError('kind must be one of %s' % ', '.join(KINDS))
+        self.db = db
+        self.kind = kind
+        self.path = path
+        self.file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+        if self.file_format not in ('csv', 'ndjson'):
+            raise ValueError('cannot tell the format of %s, pass csv or ndjson' % path)
+        self.users = models['User'].__table__
+        self.campaigns = models['Campaign'].__table__
+        self.Checkpoint = models['ImportCheckpoint']
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.password_method = password_method
+        self.salt_length = salt_length
+        self.checkpoint_name = checkpoint or '%s:%s' % (kind, os.path.abspath(path))
+        self.errors_path = errors_path or path + '.errors.csv'
+        #called with the inserted rows after every commit, the app drops the dashboards they change
+        self.on_batch = on_batch
+        self.usernames = set()
+        self.emails = set()
+        self.sponsor_ids = {}
+
+    def run(self, restart=False):
+        session = self.db.session
+        checkpoint = session.get(self.Checkpoint, self.checkpoint_name)
+        if checkpoint is None:
+            checkpoint = self.Checkpoint(name=self.checkpoint_name, rows_read=0, imported=0, rejected=0)
+            session.add(checkpoint)
+        elif restart:
+            checkpoint.rows_read = checkpoint.imported = checkpoint.rejected = 0
+        session.commit()
+        resumed_at = checkpoint.rows_read
+        pool = ProcessPoolExecutor(self.workers) if self.kind in USER_KINDS else None
+        try:
+            with open(self.errors_path, 'a' if resumed_at else 'w', newline='', encoding='utf-8') as report:
+                errors = csv.writer(report)
+                if not resumed_at:
+                    errors.writerow(['row', 'error', 'record'])
+                pending = None
+                for batch in self.batches(resumed_at):
+                    prepared = self.prepare(batch, pool)
+                    if pending:
+                        self.write(checkpoint, errors, report, *pending)
+                    pending = prepared
+                if pending:
+                    self.write(checkpoint, errors, report, *pending)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+        return {'rows_read': checkpoint.rows_read, 'imported': checkpoint.imported, 'rejected': checkpoint.rejected,
+                'resumed_at': resumed_at, 'errors_path': self.errors_path}
+
+    def batches(self, skip):
+        batch = []
+        for number, record in read_records(self.path, self.file_format):
+            if number <= skip:
+                continue
+            batch.append((number, record))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    #validates a batch and starts hashing its passwords, returns what write() needs once the previous batch is in
+    def prepare(self, batch, pool):
+        rows, rejected = [], []
+        for number, record in batch:
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                if self.kind in USER_KINDS:
+                    rows.append((number, record) + user_row(record, self.users, USER_KINDS[self.kind]))
+                else:
+                    rows.append((number, record) + campaign_row(record, self.campaigns))
+            except RowError as e:
+                rejected.append((number, str(e), record))
+        if self.kind in USER_KINDS:
+            rows = self.unique_users(rows, rejected)
+            passwords = [password for _, _, _, password in rows]
+            hashes = [pool.submit(hash_passwords, self.password_method, self.salt_length, passwords[start:start + HASH_CHUNK])
+                      for start in range(0, len(passwords), HASH_CHUNK)]
+        else:
+            rows = self.resolve_sponsors(rows, rejected)
+            hashes = []
+        return batch[-1][0], rows, hashes, rejected
+
+    #drops rows whose username or email is already taken in the database or earlier in the file, two indexed IN queries per batch
+    def unique_users(self, rows, rejected):
+        taken_usernames = set(self.db.session.execute(select(self.users.c.username).where(
+            self.users.c.username.in_({row['username'] for _, _, row, _ in rows}))).scalars())
+        taken_emails = set(self.db.session.execute(select(self.users.c.email).where(
+            self.users.c.email.in_({row['email'] for _, _, row, _ in rows}))).scalars())
+        unique = []
+        for number, record, row, password in rows:
+            if row['username'] in taken_usernames or row['username'] in self.usernames:
+                rejected.append((number, 'username %s is already taken' % row['username'], record))
+            elif row['email'] in taken_emails or row['email'] in self.emails:
+                rejected.append((number, 'email %s is already taken' % row['email'], record))
+            else:
+                self.usernames.add(row['username'])
+                self.emails.add(row['email'])
+                unique.append((number, record, row, password))
+        return unique
+
+    #looks up the sponsors named by the batch in one query, sponsors seen in earlier batches are remembered
+    def resolve_sponsors(self, rows, rejected):
+        missing = {sponsor for _, _, _, sponsor in rows if sponsor not in self.sponsor_ids}
+        if missing:
+            self.sponsor_ids.update(self.db.session.execute(select(self.users.c.username, self.users.c.id).where(
+                self.users.c.username.in_(missing), self.users.c.is_sponsor == True)).all())
+        resolved = []
+        for number, record, row, sponsor in rows:
+            if sponsor in self.sponsor_ids:
+                row['sponsor_id'] = self.sponsor_ids[sponsor]
+                resolved.append((number, record, row, sponsor))
+            else:
+                rejected.append((number, 'sponsor %s is not a sponsor' % sponsor, record))
+        return resolved
+
+    #inserts a prepared batch and moves the checkpoint past it in one transaction
+    #the batch's rejections are flushed first, a crash before the commit repeats them in the report rather than losing them
+    def write(self, checkpoint, errors, report, last_row, rows, hashes, rejected):
+        hashed = [password for future in hashes for password in future.result()]
+        values = [row for _, _, row, _ in rows]
+        for row, password in zip(values, hashed):
+            row['password'] = password
+        for number, error, record in sorted(rejected, key=lambda item: item[0]):
+            errors.writerow([number, error, report_record(record)])
+        report.flush()
+        table = self.users if self.kind in USER_KINDS else self.campaigns
+        if values:
+            self.db.session.execute(insert(table), values)
+        checkpoint.rows_read = last_row
+        checkpoint.imported += len(values)
+        checkpoint.rejected += len(rejected)
+        self.db.session.commit()
+        if self.on_batch:
+            self.on_batch(self.kind, values)
@@ -1,23 +1,54 @@
 import os
-from flask import Flask 
-from flask import render_template, request, url_for, redirect, session, flash
+import re
+import csv
+import gzip
+import hashlib
+import io
+import json
+import math
+import sqlite3
+import time
+import threading
+import click
+from flask import Flask, Blueprint, current_app
+from flask import render_template, request, url_for, redirect, session, flash, jsonify, Response, stream_with_context, abort, make_response
+from flask import g, has_request_context, before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import text, func, table, column, literal_column, case, event, make_url
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, contains_eager
+from datetime import datetime, timedelta, timezone
+from cache import make_cache
+from config import CONFIGS
+from metrics import RequestMetrics
+from passwords import PasswordHasher, HasherBusy
 
 
-curr_dir=os.path.abspath(os.path.dirname(__file__))
+db = SQLAlchemy()
+#every route, hook and CLI command of the app, registered on each app built by create_app
+bp = Blueprint('iescp', __name__, cli_group=None)
 
-#Creating a Flask instance
-app=Flask(__name__, template_folder="templates")
-app.secret_key="letsencrypt"
 
+#run on every new connection of an app's engine, see watch_engine
+def set_sqlite_pragmas(dbapi_connection, pragmas):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        #SQLite ignores foreign keys unless asked, deletes rely on their ON DELETE CASCADE to remove child rows
+        cursor.execute('PRAGMA foreign_keys=ON')
+        for pragma, value in pragmas.items():
+            cursor.execute('PRAGMA %s=%s' % (pragma, value))
+        cursor.close()
 
-#adding the database
-app.config['SQLALCHEMY_DATABASE_URI']='sqlite:///'+os.path.join(curr_dir,'iescp.sqlite3')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS']=False
 
-db = SQLAlchemy()
+#UTC time as stored in updated_at, naive like every other datetime column
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+#SQL for the same value with milliseconds, used by the row version triggers
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -34,8 +65,21 @@ class User(db.Model):
     inf_niche = db.Column(db.String(30), nullable=True)
     inf_reach = db.Column(db.Integer, nullable=True)
     sp_budget = db.Column(db.Integer, nullable=True)
-    campaigns = db.relationship('Campaign', back_populates='sponsor', cascade="all, delete-orphan")
-    ad_requests = db.relationship('AdRequest', back_populates='influencer', cascade="all, delete-orphan")
+    #passive_deletes leaves rows that are not loaded to ON DELETE CASCADE instead of loading and deleting them one by one
+    campaigns = db.relationship('Campaign', back_populates='sponsor', cascade="all, delete-orphan", passive_deletes=True)
+    ad_requests = db.relationship('AdRequest', back_populates='influencer', cascade="all, delete-orphan", passive_deletes=True)
+    #bumped by the row version triggers on every write, ETag and Last-Modified of the detail views come from these
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.text('(%s)' % NOW_SQL))
+    __table_args__ = (
+        db.Index('ix_users_is_influencer_name', 'is_influencer', 'name'),
+        db.Index('ix_users_name', 'name'),
+        db.Index('ix_users_is_influencer_facets', 'is_influencer', 'inf_category', 'inf_niche'),
+        db.Index('ix_users_is_influencer_reach', 'is_influencer', 'inf_reach'),
+    )
+
+#status of a campaign that was deleted while it still had too many ad requests to remove at once
+DELETED_CAMPAIGN_STATUS = 'deleted'
 
 # Campaign model
 class Campaign(db.Model):
@@ -43,22 +87,30 @@ class Campaign(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    start_date = db.Column(db.Date, nullable=False, default=datetime.now().date())
+    start_date = db.Column(db.Date, nullable=False, default=lambda: datetime.now().date())
     end_date = db.Column(db.Date, nullable=False)
     budget = db.Column(db.Integer, nullable=False)
     visibility = db.Column(db.String(10), nullable=False, default='public')
     goals = db.Column(db.Text, nullable=True)
-    status_camp = db.Column(db.String(10), nullable=False, default='ongoing') #ongoing, completed, cancelled
-    sponsor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status_camp = db.Column(db.String(10), nullable=False, default='ongoing') #ongoing, completed, cancelled, deleted (waiting for the purge job)
+    sponsor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     sponsor = db.relationship('User', back_populates='campaigns')
-    ad_requests = db.relationship('AdRequest', back_populates='campaign', cascade="all, delete-orphan")
+    #bumped on every write like User.version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.text('(%s)' % NOW_SQL))
+    ad_requests = db.relationship('AdRequest', back_populates='campaign', cascade="all, delete-orphan", passive_deletes=True)
+    __table_args__ = (
+        db.Index('ix_campaigns_sponsor_status', 'sponsor_id', 'status_camp'),
+        db.Index('ix_campaigns_status_visibility', 'status_camp', 'visibility'),
+        db.Index('ix_campaigns_status_end_date', 'status_camp', 'end_date'),
+    )
 
 # AdRequest model
 class AdRequest(db.Model):
     __tablename__ = 'ad_requests'
     id = db.Column(db.Integer, primary_key=True)
-    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), nullable=False)
-    influencer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id', ondelete='CASCADE'), nullable=False)
+    influencer_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     messages = db.Column(db.Text, nullable=True)
     requirements = db.Column(db.Text, nullable=False)
     payment_amount = db.Column(db.Integer, nullable=False)
@@ -66,30 +118,771 @@ class AdRequest(db.Model):
     status_adreq = db.Column(db.String(10), nullable=False, default='pending')  #pending, accepted, rejected
     campaign = db.relationship('Campaign', back_populates='ad_requests')
     influencer = db.relationship('User', back_populates='ad_requests')
-
-
-#initialising database
-db.init_app(app)
-app.app_context().push()
-
-
-#creating database if not already exists
-if os.path.exists("iescp.sqlite3")==False:
+    #bumped on every write like User.version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.text('(%s)' % NOW_SQL))
+    __table_args__ = (
+        db.Index('ix_ad_requests_influencer_status_created', 'influencer_id', 'status_adreq', 'created_by'),
+        db.Index('ix_ad_requests_campaign_status_created', 'campaign_id', 'status_adreq', 'created_by'),
+        #an influencer has at most one pending ad request per campaign, whoever sent it
+        db.Index('ix_ad_requests_pending_pair', 'campaign_id', 'influencer_id', unique=True, sqlite_where=db.text("status_adreq = 'pending'")),
+    )
+
+# SchemaVersion model, a single row holding the last migration applied to the database
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# PlatformStat model, one running counter per name such as 'users:sponsor' or 'ad_requests:status:pending'
+class PlatformStat(db.Model):
+    __tablename__ = 'platform_stats'
+    name = db.Column(db.String(60), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# SponsorStat model, running campaign count, total budget and accepted payments per sponsor
+class SponsorStat(db.Model):
+    __tablename__ = 'sponsor_stats'
+    sponsor_id = db.Column(db.Integer, primary_key=True)
+    campaigns = db.Column(db.Integer, nullable=False, default=0)
+    total_budget = db.Column(db.Integer, nullable=False, default=0)
+    committed_payment = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_sponsor_stats_total_budget', 'total_budget'),
+    )
+
+
+# Event model, the append-only change feed of each user's dashboard, one row per change and user it concerns
+#written by triggers in the transaction that made the change and read by /events after a cursor
+#user, campaign and ad request ids are kept without foreign keys, the rows outlive what they describe until the lifecycle job prunes them
+class Event(db.Model):
+    __tablename__ = 'events'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(30), nullable=False) #ad_request_created, ad_request_edited, ad_request_<new status>, ad_request_deleted, campaign_created, campaign_edited, campaign_<new status>
+    campaign_id = db.Column(db.Integer, nullable=True)
+    ad_request_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(10), nullable=True)
+    #second precision is enough for pruning and cheaper to stamp on every row than NOW_SQL
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, server_default=db.text('CURRENT_TIMESTAMP'))
+    __table_args__ = (
+        db.Index('ix_events_user_id', 'user_id', 'id'),
+    )
+
+
+# ImportCheckpoint model, how far the bulk import of one file got, moved forward in the transaction of each batch it inserts
+class ImportCheckpoint(db.Model):
+    __tablename__ = 'import_checkpoints'
+    name = db.Column(db.String(255), primary_key=True)
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+
+
+#SQL building blocks for the statistics triggers, {row} is new or old
+USER_ROLE_SQL = "'users:' || CASE WHEN {row}.is_admin THEN 'admin' WHEN {row}.is_sponsor THEN 'sponsor' WHEN {row}.is_influencer THEN 'influencer' ELSE 'other' END"
+COMMITTED_SQL = "(SELECT COALESCE(SUM(payment_amount), 0) FROM ad_requests WHERE campaign_id = {row}.id AND status_adreq = 'accepted')"
+
+
+def bump_stat_sql(name, delta):
+    return ("INSERT INTO platform_stats(name, value) VALUES (%s, %s) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value; " % (name, delta))
+
+
+def bump_sponsor_sql(select):
+    return ("INSERT INTO sponsor_stats(sponsor_id, campaigns, total_budget, committed_payment) %s "
+            "ON CONFLICT(sponsor_id) DO UPDATE SET campaigns = campaigns + excluded.campaigns, total_budget = total_budget + excluded.total_budget, "
+            "committed_payment = committed_payment + excluded.committed_payment; " % select)
+
+
+#adds or removes an accepted ad request's payment from the sponsor that owns its campaign
+def bump_committed_sql(row, sign):
+    return bump_sponsor_sql("SELECT sponsor_id, 0, 0, %s%s.payment_amount FROM campaigns WHERE id = %s.campaign_id AND %s.status_adreq = 'accepted'" % (sign, row, row, row))
+
+
+#records that an influencer's recommendation features changed, every worker replays these rows into its feature matrix
+FEATURE_CHANGE_SQL = "INSERT INTO influencer_feature_changes(influencer_id) VALUES ({id}); "
+
+
+#campaigns marked deleted and their ad requests are left out of every statistic from the moment they are hidden, not when the purge removes them
+LIVE_CAMPAIGN_SQL = "{row}.status_camp != '%s'" % DELETED_CAMPAIGN_STATUS
+#true for an ad request whose campaign is not marked deleted, including one whose campaign is being removed by a cascade
+ON_LIVE_CAMPAIGN_SQL = "NOT EXISTS (SELECT 1 FROM campaigns WHERE id = {row}.campaign_id AND status_camp = '%s')" % DELETED_CAMPAIGN_STATUS
+
+
+#rebuilds both statistics tables from scratch, run by the stats migration and by flask reconcile-stats
+RECONCILE_STATS = [
+    "DELETE FROM platform_stats",
+    "DELETE FROM sponsor_stats",
+    "INSERT INTO platform_stats(name, value) SELECT " + USER_ROLE_SQL.format(row='users') + ", COUNT(*) FROM users GROUP BY 1",
+    "INSERT INTO platform_stats(name, value) SELECT 'campaigns:status:' || status_camp, COUNT(*) FROM campaigns WHERE " + LIVE_CAMPAIGN_SQL.format(row='campaigns') + " GROUP BY 1",
+    "INSERT INTO platform_stats(name, value) SELECT 'campaigns:visibility:' || visibility, COUNT(*) FROM campaigns WHERE " + LIVE_CAMPAIGN_SQL.format(row='campaigns') + " GROUP BY 1",
+    "INSERT INTO platform_stats(name, value) SELECT 'ad_requests:status:' || status_adreq, COUNT(*) FROM ad_requests WHERE " + ON_LIVE_CAMPAIGN_SQL.format(row='ad_requests') + " GROUP BY 1",
+    "INSERT INTO platform_stats(name, value) SELECT 'ad_requests:created_by:' || created_by, COUNT(*) FROM ad_requests WHERE " + ON_LIVE_CAMPAIGN_SQL.format(row='ad_requests') + " GROUP BY 1",
+    "INSERT INTO sponsor_stats(sponsor_id, campaigns, total_budget, committed_payment) "
+    "SELECT sponsor_id, COUNT(*), SUM(budget), SUM(" + COMMITTED_SQL.format(row='campaigns') + ") FROM campaigns WHERE " + LIVE_CAMPAIGN_SQL.format(row='campaigns') + " GROUP BY sponsor_id",
+]
+
+
+#versioned migrations for databases created by an older release, applied in order by upgrade_db()
+#every statement must be safe to run on a database that create_all() has just built
+MIGRATIONS = [
+    (1, "indexes for dashboard and listing filters", [
+        "CREATE INDEX IF NOT EXISTS ix_users_is_influencer_name ON users (is_influencer, name)",
+        "CREATE INDEX IF NOT EXISTS ix_users_name ON users (name)",
+        "CREATE INDEX IF NOT EXISTS ix_campaigns_sponsor_status ON campaigns (sponsor_id, status_camp)",
+        "CREATE INDEX IF NOT EXISTS ix_campaigns_status_visibility ON campaigns (status_camp, visibility)",
+        "CREATE INDEX IF NOT EXISTS ix_ad_requests_influencer_status_created ON ad_requests (influencer_id, status_adreq, created_by)",
+        "CREATE INDEX IF NOT EXISTS ix_ad_requests_campaign_status_created ON ad_requests (campaign_id, status_adreq, created_by)",
+    ]),
+    (2, "full text index over campaign name, description and goals", [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS campaigns_fts USING fts5(name, description, goals, content='campaigns', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS campaigns_fts_insert AFTER INSERT ON campaigns BEGIN "
+        "INSERT INTO campaigns_fts(rowid, name, description, goals) VALUES (new.id, new.name, new.description, new.goals); END",
+        "CREATE TRIGGER IF NOT EXISTS campaigns_fts_delete AFTER DELETE ON campaigns BEGIN "
+        "INSERT INTO campaigns_fts(campaigns_fts, rowid, name, description, goals) VALUES ('delete', old.id, old.name, old.description, old.goals); END",
+        "CREATE TRIGGER IF NOT EXISTS campaigns_fts_update AFTER UPDATE OF name, description, goals ON campaigns BEGIN "
+        "INSERT INTO campaigns_fts(campaigns_fts, rowid, name, description, goals) VALUES ('delete', old.id, old.name, old.description, old.goals); "
+        "INSERT INTO campaigns_fts(rowid, name, description, goals) VALUES (new.id, new.name, new.description, new.goals); END",
+        "INSERT INTO campaigns_fts(campaigns_fts) VALUES ('rebuild')",
+    ]),
+    (3, "trigram index over influencer profiles and facet/reach indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_users_is_influencer_facets ON users (is_influencer, inf_category, inf_niche)",
+        "CREATE INDEX IF NOT EXISTS ix_users_is_influencer_reach ON users (is_influencer, inf_reach)",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS influencers_fts USING fts5(name, inf_category, inf_niche, content='users', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS influencers_fts_insert AFTER INSERT ON users WHEN new.is_influencer BEGIN "
+        "INSERT INTO influencers_fts(rowid, name, inf_category, inf_niche) VALUES (new.id, new.name, new.inf_category, new.inf_niche); END",
+        "CREATE TRIGGER IF NOT EXISTS influencers_fts_delete AFTER DELETE ON users WHEN old.is_influencer BEGIN "
+        "INSERT INTO influencers_fts(influencers_fts, rowid, name, inf_category, inf_niche) VALUES ('delete', old.id, old.name, old.inf_category, old.inf_niche); END",
+        "CREATE TRIGGER IF NOT EXISTS influencers_fts_update AFTER UPDATE OF name, inf_category, inf_niche, is_influencer ON users BEGIN "
+        "INSERT INTO influencers_fts(influencers_fts, rowid, name, inf_category, inf_niche) SELECT 'delete', old.id, old.name, old.inf_category, old.inf_niche WHERE old.is_influencer; "
+        "INSERT INTO influencers_fts(rowid, name, inf_category, inf_niche) SELECT new.id, new.name, new.inf_category, new.inf_niche WHERE new.is_influencer; END",
+        "INSERT INTO influencers_fts(influencers_fts) VALUES ('delete-all')",
+        "INSERT INTO influencers_fts(rowid, name, inf_category, inf_niche) SELECT id, name, inf_category, inf_niche FROM users WHERE is_influencer",
+    ]),
+    (4, "platform statistics kept current by triggers", [
+        "CREATE TABLE IF NOT EXISTS platform_stats (name VARCHAR(60) NOT NULL PRIMARY KEY, value INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS sponsor_stats (sponsor_id INTEGER NOT NULL PRIMARY KEY, campaigns INTEGER NOT NULL, "
+        "total_budget INTEGER NOT NULL, committed_payment INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_sponsor_stats_total_budget ON sponsor_stats (total_budget)",
+        "CREATE TRIGGER IF NOT EXISTS stats_users_insert AFTER INSERT ON users BEGIN "
+        + bump_stat_sql(USER_ROLE_SQL.format(row='new'), 1) + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_users_delete AFTER DELETE ON users BEGIN "
+        + bump_stat_sql(USER_ROLE_SQL.format(row='old'), -1) + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_users_update AFTER UPDATE OF is_admin, is_sponsor, is_influencer ON users BEGIN "
+        + bump_stat_sql(USER_ROLE_SQL.format(row='old'), -1) + bump_stat_sql(USER_ROLE_SQL.format(row='new'), 1) + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_campaigns_insert AFTER INSERT ON campaigns BEGIN "
+        + bump_stat_sql("'campaigns:status:' || new.status_camp", 1) + bump_stat_sql("'campaigns:visibility:' || new.visibility", 1)
+        + bump_sponsor_sql("VALUES (new.sponsor_id, 1, new.budget, 0)") + "END",
+        #runs before the delete so the campaign's accepted payments are still there to subtract,
+        #ad requests removed later by a cascade no longer find their campaign and leave the sponsor alone
+        "CREATE TRIGGER IF NOT EXISTS stats_campaigns_delete BEFORE DELETE ON campaigns BEGIN "
+        + bump_stat_sql("'campaigns:status:' || old.status_camp", -1) + bump_stat_sql("'campaigns:visibility:' || old.visibility", -1)
+        + bump_sponsor_sql("VALUES (old.sponsor_id, -1, -old.budget, -" + COMMITTED_SQL.format(row='old') + ")") + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_campaigns_update AFTER UPDATE OF status_camp, visibility, budget, sponsor_id ON campaigns BEGIN "
+        + bump_stat_sql("'campaigns:status:' || old.status_camp", -1) + bump_stat_sql("'campaigns:visibility:' || old.visibility", -1)
+        + bump_stat_sql("'campaigns:status:' || new.status_camp", 1) + bump_stat_sql("'campaigns:visibility:' || new.visibility", 1)
+        + bump_sponsor_sql("VALUES (old.sponsor_id, -1, -old.budget, -" + COMMITTED_SQL.format(row='old') + ")")
+        + bump_sponsor_sql("VALUES (new.sponsor_id, 1, new.budget, " + COMMITTED_SQL.format(row='new') + ")") + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_ad_requests_insert AFTER INSERT ON ad_requests BEGIN "
+        + bump_stat_sql("'ad_requests:status:' || new.status_adreq", 1) + bump_stat_sql("'ad_requests:created_by:' || new.created_by", 1)
+        + bump_committed_sql('new', '') + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_ad_requests_delete AFTER DELETE ON ad_requests BEGIN "
+        + bump_stat_sql("'ad_requests:status:' || old.status_adreq", -1) + bump_stat_sql("'ad_requests:created_by:' || old.created_by", -1)
+        + bump_committed_sql('old', '-') + "END",
+        "CREATE TRIGGER IF NOT EXISTS stats_ad_requests_update AFTER UPDATE OF status_adreq, created_by, payment_amount, campaign_id ON ad_requests BEGIN "
+        + bump_stat_sql("'ad_requests:status:' || old.status_adreq", -1) + bump_stat_sql("'ad_requests:created_by:' || old.created_by", -1)
+        + bump_stat_sql("'ad_requests:status:' || new.status_adreq", 1) + bump_stat_sql("'ad_requests:created_by:' || new.created_by", 1)
+        + bump_committed_sql('old', '-') + bump_committed_sql('new', '') + "END",
+    ] + RECONCILE_STATS),
+    (5, "index for finding ongoing campaigns past their end date", [
+        "CREATE INDEX IF NOT EXISTS ix_campaigns_status_end_date ON campaigns (status_camp, end_date)",
+    ]),
+    (6, "log of influencers whose recommendation features changed", [
+        "CREATE TABLE IF NOT EXISTS influencer_feature_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, influencer_id INTEGER NOT NULL)",
+        "CREATE TRIGGER IF NOT EXISTS features_users_insert AFTER INSERT ON users WHEN new.is_influencer BEGIN "
+        + FEATURE_CHANGE_SQL.format(id='new.id') + "END",
+        "CREATE TRIGGER IF NOT EXISTS features_users_update AFTER UPDATE OF is_influencer, inf_category, inf_niche, inf_reach ON users "
+        "WHEN old.is_influencer OR new.is_influencer BEGIN " + FEATURE_CHANGE_SQL.format(id='new.id') + "END",
+        "CREATE TRIGGER IF NOT EXISTS features_users_delete AFTER DELETE ON users WHEN old.is_influencer BEGIN "
+        + FEATURE_CHANGE_SQL.format(id='old.id') + "END",
+        "CREATE TRIGGER IF NOT EXISTS features_ad_requests_insert AFTER INSERT ON ad_requests "
+        "WHEN new.status_adreq IN ('accepted', 'rejected') BEGIN " + FEATURE_CHANGE_SQL.format(id='new.influencer_id') + "END",
+        "CREATE TRIGGER IF NOT EXISTS features_ad_requests_update AFTER UPDATE OF status_adreq, influencer_id ON ad_requests "
+        "WHEN old.status_adreq IN ('accepted', 'rejected') OR new.status_adreq IN ('accepted', 'rejected') BEGIN "
+        + FEATURE_CHANGE_SQL.format(id='new.influencer_id')
+        + "INSERT INTO influencer_feature_changes(influencer_id) SELECT old.influencer_id WHERE old.influencer_id != new.influencer_id; END",
+        "CREATE TRIGGER IF NOT EXISTS features_ad_requests_delete AFTER DELETE ON ad_requests "
+        "WHEN old.status_adreq IN ('accepted', 'rejected') BEGIN " + FEATURE_CHANGE_SQL.format(id='old.influencer_id') + "END",
+    ]),
+]
+
+
+#SQLite cannot add ON DELETE CASCADE to an existing foreign key, so campaigns and ad_requests are copied into new tables that have it
+#rows pointing at a missing parent are left behind, and the indexes and triggers dropped with the old tables are created again
+#from the migrations that added them; upgrade_db runs this with foreign keys off so dropping a parent table deletes nothing
+def cascade_rebuild_sql():
+    recreate = [statement for _, _, statements in MIGRATIONS for statement in statements
+                if statement.startswith(('CREATE INDEX', 'CREATE TRIGGER')) and (' ON campaigns ' in statement or ' ON ad_requests ' in statement)]
+    return [
+        "CREATE TABLE campaigns_new (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, description TEXT NOT NULL, start_date DATE NOT NULL, "
+        "end_date DATE NOT NULL, budget INTEGER NOT NULL, visibility VARCHAR(10) NOT NULL, goals TEXT, status_camp VARCHAR(10) NOT NULL, "
+        "sponsor_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(sponsor_id) REFERENCES users (id) ON DELETE CASCADE)",
+        "CREATE TABLE ad_requests_new (id INTEGER NOT NULL, campaign_id INTEGER NOT NULL, influencer_id INTEGER NOT NULL, messages TEXT, "
+        "requirements TEXT NOT NULL, payment_amount INTEGER NOT NULL, created_by VARCHAR(10) NOT NULL, status_adreq VARCHAR(10) NOT NULL, "
+        "PRIMARY KEY (id), FOREIGN KEY(campaign_id) REFERENCES campaigns (id) ON DELETE CASCADE, FOREIGN KEY(influencer_id) REFERENCES users (id) ON DELETE CASCADE)",
+        "INSERT INTO campaigns_new (id, name, description, start_date, end_date, budget, visibility, goals, status_camp, sponsor_id) "
+        "SELECT id, name, description, start_date, end_date, budget, visibility, goals, status_camp, sponsor_id FROM campaigns "
+        "WHERE sponsor_id IN (SELECT id FROM users)",
+        "INSERT INTO ad_requests_new (id, campaign_id, influencer_id, messages, requirements, payment_amount, created_by, status_adreq) "
+        "SELECT id, campaign_id, influencer_id, messages, requirements, payment_amount, created_by, status_adreq FROM ad_requests "
+        "WHERE campaign_id IN (SELECT id FROM campaigns_new) AND influencer_id IN (SELECT id FROM users)",
+        "DROP TABLE ad_requests",
+        "DROP TABLE campaigns",
+        "ALTER TABLE campaigns_new RENAME TO campaigns",
+        "ALTER TABLE ad_requests_new RENAME TO ad_requests",
+        "INSERT INTO campaigns_fts(campaigns_fts) VALUES ('rebuild')",
+    ] + recreate + RECONCILE_STATS
+
+
+MIGRATIONS.append((7, "ON DELETE CASCADE foreign keys for campaigns and ad requests", cascade_rebuild_sql()))
+
+
+#a migration step that adds a column unless create_all already made it, SQLite has no ADD COLUMN IF NOT EXISTS
+def add_column(table_name, column_sql):
+    def add(session):
+        columns = [row[1] for row in session.execute(text('PRAGMA table_info(%s)' % table_name))]
+        if column_sql.split()[0] not in columns:
+            session.execute(text('ALTER TABLE %s ADD COLUMN %s' % (table_name, column_sql)))
+    return add
+
+
+#SQLite only allows a constant default on an added column, so existing rows are stamped with the upgrade time afterwards
+#the trigger bumps version and updated_at after any UPDATE that did not set version itself, set-based and raw SQL updates included
+def row_version_sql(table_name):
+    return [
+        add_column(table_name, "version INTEGER NOT NULL DEFAULT 1"),
+        add_column(table_name, "updated_at DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00'"),
+        "UPDATE %s SET updated_at = %s WHERE updated_at = '1970-01-01 00:00:00'" % (table_name, NOW_SQL),
+        "CREATE TRIGGER IF NOT EXISTS %s_row_version AFTER UPDATE ON %s WHEN new.version = old.version BEGIN "
+        "UPDATE %s SET version = old.version + 1, updated_at = %s WHERE id = new.id; END" % (table_name, table_name, table_name, NOW_SQL),
+    ]
+
+
+MIGRATIONS.append((8, "row versions for users, campaigns and ad requests", row_version_sql('users') + row_version_sql('campaigns') + row_version_sql('ad_requests')))
+
+
+#appends one event per user the change concerns, users is a SELECT of user ids and may name the same user twice
+def event_sql(kind, users, campaign_id, ad_request_id, status):
+    return ("INSERT INTO events(user_id, kind, campaign_id, ad_request_id, status) SELECT DISTINCT user_id, %s, %s, %s, %s FROM (%s); "
+            % (kind, campaign_id, ad_request_id, status, users))
+
+
+#the influencer of an ad request and the sponsor of its campaign; a campaign waiting for the purge already told its sponsor it is gone
+def ad_request_users_sql(row):
+    return ("SELECT %s.influencer_id AS user_id UNION ALL SELECT sponsor_id FROM campaigns WHERE id = %s.campaign_id AND status_camp != '%s'"
+            % (row, row, DELETED_CAMPAIGN_STATUS))
+
+
+#a campaign's sponsor and every influencer with an ad request on it
+def campaign_users_sql(row):
+    return "SELECT %s.sponsor_id AS user_id UNION ALL SELECT influencer_id FROM ad_requests WHERE campaign_id = %s.id" % (row, row)
+
+
+EVENT_KIND_SQL = "CASE WHEN new.{status} != old.{status} THEN '{entity}_' || new.{status} ELSE '{entity}_edited' END"
+
+
+#the row version triggers only set version and updated_at, so the column lists keep their UPDATE from adding a second event
+MIGRATIONS.append((9, "event log for the dashboard change feed", [
+    "CREATE TABLE IF NOT EXISTS events (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, kind VARCHAR(30) NOT NULL, "
+    "campaign_id INTEGER, ad_request_id INTEGER, status VARCHAR(10), created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)",
+    "CREATE INDEX IF NOT EXISTS ix_events_user_id ON events (user_id, id)",
+    "CREATE TRIGGER IF NOT EXISTS events_ad_requests_insert AFTER INSERT ON ad_requests BEGIN "
+    + event_sql("'ad_request_created'", ad_request_users_sql('new'), 'new.campaign_id', 'new.id', 'new.status_adreq') + "END",
+    "CREATE TRIGGER IF NOT EXISTS events_ad_requests_update AFTER UPDATE OF campaign_id, influencer_id, messages, requirements, payment_amount, status_adreq ON ad_requests BEGIN "
+    + event_sql(EVENT_KIND_SQL.format(status='status_adreq', entity='ad_request'),
+                ad_request_users_sql('new') + " UNION ALL " + ad_request_users_sql('old'), 'new.campaign_id', 'new.id', 'new.status_adreq') + "END",
+    "CREATE TRIGGER IF NOT EXISTS events_ad_requests_delete AFTER DELETE ON ad_requests BEGIN "
+    + event_sql("'ad_request_deleted'", ad_request_users_sql('old'), 'old.campaign_id', 'old.id', 'old.status_adreq') + "END",
+    "CREATE TRIGGER IF NOT EXISTS events_campaigns_insert AFTER INSERT ON campaigns BEGIN "
+    + event_sql("'campaign_created'", "SELECT new.sponsor_id AS user_id", 'new.id', 'NULL', 'new.status_camp') + "END",
+    "CREATE TRIGGER IF NOT EXISTS events_campaigns_update AFTER UPDATE OF name, description, start_date, end_date, budget, visibility, goals, status_camp, sponsor_id ON campaigns BEGIN "
+    + event_sql(EVENT_KIND_SQL.format(status='status_camp', entity='campaign'), campaign_users_sql('new'), 'new.id', 'NULL', 'new.status_camp') + "END",
+    #runs before the delete while the ad requests are still there to name their influencers, a campaign marked deleted has already said so
+    "CREATE TRIGGER IF NOT EXISTS events_campaigns_delete BEFORE DELETE ON campaigns WHEN old.status_camp != '%s' BEGIN " % DELETED_CAMPAIGN_STATUS
+    + event_sql("'campaign_deleted'", campaign_users_sql('old'), 'old.id', 'NULL', "'deleted'") + "END",
+]))
+
+MIGRATIONS.append((10, "checkpoints of bulk imports", [
+    "CREATE TABLE IF NOT EXISTS import_checkpoints (name VARCHAR(255) NOT NULL PRIMARY KEY, rows_read INTEGER NOT NULL, "
+    "imported INTEGER NOT NULL, rejected INTEGER NOT NULL)",
+]))
+
+#duplicates from before the index keep their oldest pending request and the others expire like the lifecycle job expires stale ones
+MIGRATIONS.append((11, "one pending ad request per campaign and influencer", [
+    "UPDATE ad_requests SET status_adreq = 'expired' WHERE status_adreq = 'pending' AND id NOT IN "
+    "(SELECT MIN(id) FROM ad_requests WHERE status_adreq = 'pending' GROUP BY campaign_id, influencer_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_ad_requests_pending_pair ON ad_requests (campaign_id, influencer_id) WHERE status_adreq = 'pending'",
+]))
+
+
+#bump_stat_sql for a change that only counts when condition holds, SQLite needs the WHERE to tell the upsert from a join
+def bump_stat_where_sql(name, delta, condition):
+    return ("INSERT INTO platform_stats(name, value) SELECT %s, %s WHERE %s "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value; " % (name, delta, condition))
+
+
+def bump_ad_request_stats_sql(row, sign):
+    live = ON_LIVE_CAMPAIGN_SQL.format(row=row)
+    return (bump_stat_where_sql("'ad_requests:status:' || %s.status_adreq" % row, sign + '1', live)
+            + bump_stat_where_sql("'ad_requests:created_by:' || %s.created_by" % row, sign + '1', live)
+            + bump_sponsor_sql("SELECT sponsor_id, 0, 0, %s%s.payment_amount FROM campaigns WHERE id = %s.campaign_id AND %s.status_adreq = 'accepted' AND %s"
+                               % (sign, row, row, row, LIVE_CAMPAIGN_SQL.format(row='campaigns'))))
+
+
+def bump_campaign_stats_sql(row, sign):
+    live = LIVE_CAMPAIGN_SQL.format(row=row)
+    return (bump_stat_where_sql("'campaigns:status:' || %s.status_camp" % row, sign + '1', live)
+            + bump_stat_where_sql("'campaigns:visibility:' || %s.visibility" % row, sign + '1', live)
+            + bump_sponsor_sql("SELECT %s.sponsor_id, %s1, %s%s.budget, %s%s WHERE %s" % (row, sign, sign, row, sign, COMMITTED_SQL.format(row=row), live)))
+
+
+#moves a campaign's ad requests out of the counters when it is marked deleted, and back in if it ever leaves that status
+def bump_hidden_ad_requests_sql(column):
+    return ("INSERT INTO platform_stats(name, value) SELECT 'ad_requests:%s:' || %s, "
+            "CASE WHEN new.status_camp = '%s' THEN -COUNT(*) ELSE COUNT(*) END FROM ad_requests "
+            "WHERE campaign_id = new.id AND (old.status_camp = '%s') != (new.status_camp = '%s') GROUP BY 1 "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value; "
+            % ('status' if column == 'status_adreq' else column, column, DELETED_CAMPAIGN_STATUS, DELETED_CAMPAIGN_STATUS, DELETED_CAMPAIGN_STATUS))
+
+
+#the triggers of version 4 counted a campaign marked deleted until the purge removed it, these leave it out as soon as it is marked
+#the purge's DELETEs then find it already gone from the counters and change nothing
+MIGRATIONS.append((12, "statistics leave out campaigns marked deleted", [
+    "DROP TRIGGER IF EXISTS " + name for name in ('stats_campaigns_insert', 'stats_campaigns_delete', 'stats_campaigns_update',
+                                                 'stats_ad_requests_insert', 'stats_ad_requests_delete', 'stats_ad_requests_update')
+] + [
+    "CREATE TRIGGER IF NOT EXISTS stats_campaigns_insert AFTER INSERT ON campaigns BEGIN " + bump_campaign_stats_sql('new', '') + "END",
+    #runs before the delete so the campaign's accepted payments are still there to subtract,
+    #ad requests removed later by a cascade no longer find their campaign and leave the sponsor alone
+    "CREATE TRIGGER IF NOT EXISTS stats_campaigns_delete BEFORE DELETE ON campaigns BEGIN " + bump_campaign_stats_sql('old', '-') + "END",
+    "CREATE TRIGGER IF NOT EXISTS stats_campaigns_update AFTER UPDATE OF status_camp, visibility, budget, sponsor_id ON campaigns BEGIN "
+    + bump_campaign_stats_sql('old', '-') + bump_campaign_stats_sql('new', '')
+    + bump_hidden_ad_requests_sql('status_adreq') + bump_hidden_ad_requests_sql('created_by') + "END",
+    "CREATE TRIGGER IF NOT EXISTS stats_ad_requests_insert AFTER INSERT ON ad_requests BEGIN " + bump_ad_request_stats_sql('new', '') + "END",
+    "CREATE TRIGGER IF NOT EXISTS stats_ad_requests_delete AFTER DELETE ON ad_requests BEGIN " + bump_ad_request_stats_sql('old', '-') + "END",
+    "CREATE TRIGGER IF NOT EXISTS stats_ad_requests_update AFTER UPDATE OF status_adreq, created_by, payment_amount, campaign_id ON ad_requests BEGIN "
+    + bump_ad_request_stats_sql('old', '-') + bump_ad_request_stats_sql('new', '') + "END",
+] + RECONCILE_STATS))
+
+#the FTS5 index kept in sync with the campaigns table by the triggers above
+campaigns_fts = table('campaigns_fts', column('rowid'))
+
+
+#turns free text typed by the user into an FTS5 query, every word matched as a prefix
+def fts_query(search_query):
+    return ' '.join('"%s"*' % term for term in re.findall(r'\w+', search_query))
+
+
+#public ongoing campaigns matching the search, best BM25 match first
+#status_camp is compared as an expression so SQLite always drives the join from the FTS match
+#instead of walking every ongoing public campaign through ix_campaigns_status_visibility
+def search_campaigns(search_query):
+    return (db.select(Campaign)
+            .join(campaigns_fts, campaigns_fts.c.rowid == Campaign.id)
+            .filter(literal_column('campaigns_fts').op('MATCH')(fts_query(search_query)),
+                    Campaign.status_camp.concat('') == 'ongoing', Campaign.visibility == 'public')
+            .order_by(func.bm25(literal_column('campaigns_fts'))))
+
+
+#the trigram FTS5 index over influencer name, category and niche, kept in sync by the triggers above
+influencers_fts = table('influencers_fts', column('rowid'))
+
+
+#two FTS5 queries for the words typed by the user, words shorter than three letters are left out
+#the strict one needs every word, each through a run of at least share of its trigrams, so a typo that breaks a few trigrams still matches
+#the loose one takes any trigram of any word and is only used when the strict one matches nothing
+def trigram_query(search_query, share):
+    words = [word for word in re.findall(r'\w+', search_query.lower()) if len(word) >= 3]
+    if not words:
+        return '', ''
+    clauses = []
+    for word in dict.fromkeys(words):
+        length = max(1, math.ceil((len(word) - 2) * share)) + 2
+        clauses.append(' OR '.join('"%s"' % run for run in sorted({word[i:i + length] for i in range(len(word) - length + 1)})))
+    trigrams = {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+    strict = clauses[0] if len(clauses) == 1 else ' AND '.join('(%s)' % clause for clause in clauses)
+    return strict, ' OR '.join('"%s"' % trigram for trigram in sorted(trigrams))
+
+
+#the MATCH condition for the search text, the fallback to the loose query is decided inside SQLite so the page and facet queries agree
+def trigram_match(search_query):
+    strict, loose = trigram_query(search_query, current_app.config['SEARCH_TRIGRAM_SHARE'])
+    if not strict:
+        return None
+    fts = literal_column('influencers_fts')
+    if strict != loose:
+        found = db.select(literal_column('1')).select_from(influencers_fts).filter(fts.op('MATCH')(strict)).correlate(None).exists()
+        return fts.op('MATCH')(case((found, strict), else_=loose))
+    return fts.op('MATCH')(strict)
+
+
+#influencers matching the search text and the reach/category/niche filters, best match first
+#skip_category and skip_niche leave one facet unfiltered so its counts show the other choices
+def search_influencers(search_query='', category=None, niche=None, reach_min=None, reach_max=None, skip_category=False, skip_niche=False):
+    query = db.select(User)
+    match = trigram_match(search_query)
+    if match is not None:
+        query = (query.join(influencers_fts, influencers_fts.c.rowid == User.id)
+                 .filter(match)
+                 .order_by(func.bm25(literal_column('influencers_fts'), 4.0, 1.0, 1.0), User.id))
+    else:
+        query = query.filter(User.is_influencer == True).order_by(User.inf_reach.desc(), User.id)
+        if search_query.strip():
+            query = query.filter(User.name.ilike(search_query.strip() + '%'))
+    if category and not skip_category:
+        query = query.filter(User.inf_category == category)
+    if niche and not skip_niche:
+        query = query.filter(User.inf_niche == niche)
+    if reach_min is not None:
+        query = query.filter(User.inf_reach >= reach_min)
+    if reach_max is not None:
+        query = query.filter(User.inf_reach <= reach_max)
+    return query
+
+
+#number of matching influencers per value of a facet column, largest first
+#only the first FACET_SCAN_MAX matches are counted, so a broad search gets lower bounds instead of a count of every match
+def influencer_facet_counts(facet_column, query):
+    ids = query.with_only_columns(User.id).order_by(None).limit(current_app.config['FACET_SCAN_MAX'])
+    return db.session.execute(db.select(facet_column, func.count(User.id))
+                              .filter(User.id.in_(ids), facet_column.isnot(None))
+                              .group_by(facet_column).order_by(func.count(User.id).desc())).all()
+
+
+#the per-user dashboard cache of the current app, made by create_app
+def dashboard_cache():
+    return current_app.extensions['dashboard_cache']
+
+
+#campaigns marked deleted are waiting for the purge job and no page shows them any more
+def get_campaign_or_404(campaign_id, **kwargs):
+    campaign = db.get_or_404(Campaign, campaign_id, **kwargs)
+    if campaign.status_camp == DELETED_CAMPAIGN_STATUS:
+        abort(404)
+    return campaign
+
+
+#commits a new pending ad request, False when the campaign and influencer already have one (the unique pending index)
+def commit_pending_ad_request():
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+#a campaign of the logged in sponsor, other sponsors' campaigns answer 404 like missing ones
+def get_own_campaign_or_404(campaign_id):
+    campaign = get_campaign_or_404(campaign_id)
+    if campaign.sponsor_id != session["user_id"]:
+        abort(404)
+    return campaign
+
+
+#digest of every template, so a deploy that changes how a page looks also changes its ETag
+def template_digest():
+    digest = current_app.extensions.get('template_digest')
+    if digest is None:
+        sha = hashlib.sha1()
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as f:
+                sha.update(name.encode() + f.read())
+        digest = current_app.extensions['template_digest'] = sha.hexdigest()[:16]
+    return digest
+
+
+#weak validators, a compressed body is still the same version; no-cache makes the browser ask every time, cheaply
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+#answers 304 when the browser already holds this version of the rows, otherwise builds the body and attaches the validators
+#rows are models whose version and updated_at the triggers keep current, extra is anything else the body depends on
+#the ETag also covers the viewer and the URL since pages differ per user
+#a page showing flash messages gets no validators, the browser must not keep it for later visits
+def versioned_response(rows, build, extra=()):
+    if '_flashes' in session:
+        return make_response(build())
+    etag = hashlib.sha1(repr((template_digest(), session.get('user_id'), request.full_path,
+                              [(row.__tablename__, row.id, row.version) for row in rows], extra)).encode()).hexdigest()
+    last_modified = max([row.updated_at for row in rows] + [value for value in extra if isinstance(value, datetime)])
+    response = set_validators(current_app.response_class(), etag, last_modified).make_conditional(request)
+    if response.status_code == 304:
+        return response
+    return set_validators(make_response(build()), etag, last_modified)
+
+
+#number of ad requests matching the filters and when they or their influencers last changed, part of a page's ETag
+def ad_requests_version(*filters):
+    return tuple(db.session.execute(db.select(func.count(AdRequest.id), func.max(AdRequest.updated_at), func.max(User.updated_at))
+                                    .join(AdRequest.influencer).filter(*filters)).one())
+
+
+#returns a user's cached dashboard, loading and storing it on a miss or when it is older than the user's newest event
+#every write that changes a dashboard logs an event for its users through the triggers, in whichever worker or process
+#it ran, so comparing the cursor the data was read at with the newest event id catches writes the local cache never saw;
+#a reader that loaded rows before a write stores them with the older cursor and the next read reloads them
+def cached_dashboard(key, user_id, loader):
+    cursor = latest_event_id(user_id)
+    value = dashboard_cache().get(key)
+    if value is None or value['events_cursor'] != cursor:
+        value = loader()
+        dashboard_cache().set(key, value)
+    return value
+
+
+#drops the cached dashboards of the given users in this process or in Redis, called after every write that changes what they show
+#other processes with an in-process cache notice the change through the event cursor checked by cached_dashboard
+def invalidate_dashboards(sponsor_ids=(), influencer_ids=()):
+    keys = ['dashboard:sponsor:%s' % sponsor_id for sponsor_id in set(sponsor_ids)]
+    keys += ['dashboard:influencer:%s' % influencer_id for influencer_id in set(influencer_ids)]
+    dashboard_cache().delete(*keys)
+
+
+#drops the dashboards of the influencers and the sponsors behind the given ad requests
+def invalidate_ad_request_dashboards(campaign_ids, influencer_ids):
+    sponsor_ids = db.session.execute(db.select(Campaign.sponsor_id).filter(Campaign.id.in_(set(campaign_ids)))).scalars()
+    invalidate_dashboards(sponsor_ids=sponsor_ids, influencer_ids=influencer_ids)
+
+
+#drops the dashboards of a campaign's sponsor and of every influencer with an ad request on it
+def invalidate_campaign_dashboards(campaign_id, sponsor_id):
+    influencer_ids = db.session.execute(db.select(AdRequest.influencer_id).filter(AdRequest.campaign_id == campaign_id).distinct()).scalars()
+    invalidate_dashboards(sponsor_ids=[sponsor_id], influencer_ids=influencer_ids)
+
+
+#the data behind the sponsor dashboard as plain dicts, so it can be cached and shared between workers
+#events_cursor is read first, so events the feed sends later may repeat a change the data already shows but never miss one
+def sponsor_dashboard_data(sponsor_id):
+    events_cursor = latest_event_id(sponsor_id)
+    ongoing_campaigns = db.session.execute(db.select(Campaign.id, Campaign.name, Campaign.description).filter(Campaign.status_camp=='ongoing',Campaign.sponsor_id==sponsor_id)).mappings()
+    received_ad_requests = db.session.execute(db.select(AdRequest.id, AdRequest.messages, AdRequest.campaign_id, User.name)
+                                              .join(Campaign, AdRequest.campaign_id == Campaign.id).join(User, AdRequest.influencer_id == User.id)
+                                              .filter(AdRequest.created_by == 'influencer', AdRequest.status_adreq == 'pending', Campaign.sponsor_id == sponsor_id,
+                                                      Campaign.status_camp != DELETED_CAMPAIGN_STATUS))
+    return {'events_cursor': events_cursor,
+            'ongoing_campaigns': [dict(campaign) for campaign in ongoing_campaigns],
+            'ad_requests': [{'id': ad_request.id, 'messages': ad_request.messages, 'campaign': {'id': ad_request.campaign_id}, 'influencer': {'name': ad_request.name}}
+                            for ad_request in received_ad_requests]}
+
+
+#the data behind the influencer dashboard as plain dicts, so it can be cached and shared between workers
+def influencer_dashboard_data(influencer_id):
+    events_cursor = latest_event_id(influencer_id)
+    influencer = db.session.execute(db.select(User.username, User.email, User.inf_reach, User.inf_category, User.inf_niche).filter(User.id == influencer_id)).mappings().first()
+    ongoing_campaigns = db.session.execute(db.select(Campaign.id, Campaign.name, Campaign.description).join(Campaign.ad_requests).filter(Campaign.status_camp == 'ongoing',AdRequest.influencer_id == influencer_id,AdRequest.status_adreq == 'accepted').distinct()).mappings()
+    ad_requests = db.session.execute(db.select(AdRequest.id, Campaign.id.label('campaign_id'), Campaign.name, Campaign.description).join(Campaign)
+                                     .filter(Campaign.status_camp == 'ongoing',AdRequest.influencer_id == influencer_id,AdRequest.status_adreq == 'pending', AdRequest.created_by=="sponsor"))
+    return {'events_cursor': events_cursor,
+            'influencer': dict(influencer) if influencer else None,
+            'ongoing_campaigns': [dict(campaign) for campaign in ongoing_campaigns],
+            'ad_requests': [{'id': ad_request.id, 'campaign': {'id': ad_request.campaign_id, 'name': ad_request.name, 'description': ad_request.description}}
+                            for ad_request in ad_requests]}
+
+
+def reconcile_stats():
+    for statement in RECONCILE_STATS:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+#the numbers for the admin statistics panel, read from the summary tables in two queries
+def platform_stats():
+    counts = dict(db.session.execute(db.select(PlatformStat.name, PlatformStat.value)).all())
+    top_sponsors = db.session.execute(db.select(User.username, SponsorStat.campaigns, SponsorStat.total_budget, SponsorStat.committed_payment)
+                                      .join(User, User.id == SponsorStat.sponsor_id)
+                                      .order_by(SponsorStat.total_budget.desc()).limit(current_app.config['STATS_TOP_SPONSORS'])).all()
+    return {'counts': counts, 'top_sponsors': top_sponsors}
+
+
+#the per-route metrics of the current app, made by create_app
+def request_metrics():
+    return current_app.extensions['request_metrics']
+
+
+def password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+#every statement is timed, statements run while serving a request are added to the request's totals on g
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def stop_query_timer(app, conn, statement, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    endpoint = request.endpoint if has_request_context() else None
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_time += elapsed
+    #bulk inserts through executemany are expected to take long and are left out of the slow query log
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS'] and not executemany:
+        app.logger.warning('Slow query (%.1fms) on %s: %s', elapsed * 1000, endpoint or 'no request', statement)
+        app.extensions['request_metrics'].slow_query(endpoint or 'none')
+
+
+#a statement that raised never reaches after_cursor_execute, its start time is dropped so the next statement on the connection pops its own
+#errors raised while connecting have no connection and no timer to drop
+def drop_query_timer(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+#hooks the pragmas and the query timer into the engine of one app, with that app's settings bound in
+#they go on the engine rather than the Engine class so engines made outside the app, with or without an app context, are left alone
+def watch_engine(app, engine):
+    event.listen(engine, 'connect', lambda dbapi_connection, connection_record: set_sqlite_pragmas(dbapi_connection, app.config['SQLITE_PRAGMAS']))
+    event.listen(engine, 'before_cursor_execute', start_query_timer)
+    event.listen(engine, 'after_cursor_execute', lambda conn, cursor, statement, parameters, context, executemany:
+                 stop_query_timer(app, conn, statement, executemany))
+    event.listen(engine, 'handle_error', drop_query_timer)
+
+
+@before_render_template.connect
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+@template_rendered.connect
+def stop_template_timer(sender, template, context, **extra):
+    if 'template_time' in g:
+        g.template_time += time.perf_counter() - g.template_started
+
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    g.template_time = 0.0
+
+
+#checks the query budget and records the request, streamed responses only count the queries run before streaming starts
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    duration = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    budget = current_app.config['QUERY_BUDGETS'].get(endpoint, current_app.config['QUERY_BUDGET'])
+    if budget and g.sql_queries > budget:
+        request_metrics().over_budget(endpoint)
+        message = '%s ran %d queries, over its budget of %d' % (endpoint, g.sql_queries, budget)
+        if current_app.config['QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    if current_app.config['METRICS_ENABLED']:
+        request_metrics().observe(endpoint, request.method, response.status_code, duration, g.sql_queries, g.sql_time, g.template_time,
+                                None if response.is_streamed else response.calculate_content_length())
+    if current_app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = 'db;dur=%.2f;desc="%d queries", tpl;dur=%.2f, total;dur=%.2f' % (
+            g.sql_time * 1000, g.sql_queries, g.template_time * 1000, duration * 1000)
+    return response
+
+
+#content hash of a file under static/, read again only when the file changes
+def static_hash(filename):
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.path.getmtime(path)
+    hashes = current_app.extensions.setdefault('static_hashes', {})
+    if filename not in hashes or hashes[filename][0] != mtime:
+        with open(path, 'rb') as f:
+            hashes[filename] = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+    return hashes[filename][1]
+
+
+#URL of a static file carrying its content hash, a changed file gets a new URL so the old one can be cached for good
+@bp.app_template_global()
+def static_url(filename):
+    return url_for('static', filename=filename, v=static_hash(filename))
+
+
+@bp.after_app_request
+def cache_static_files(response):
+    if request.endpoint == 'static' and response.status_code == 200 and request.args.get('v') == static_hash(request.view_args['filename']):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+#gzips HTML and JSON bodies of at least COMPRESS_MIN_BYTES for clients that accept it, streamed and file responses are left alone
+#registered after record_request_metrics so it runs first and the metrics see the compressed size
+@bp.after_app_request
+def compress_response(response):
+    if (not current_app.config['COMPRESS_MIN_BYTES'] or response.mimetype not in current_app.config['COMPRESS_MIMETYPES']
+            or response.direct_passthrough or response.is_streamed):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers or 'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) >= current_app.config['COMPRESS_MIN_BYTES']:
+        response.set_data(gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+#creates missing tables and applies pending migrations, run once per deploy with the upgrade-db command, never by workers
+def upgrade_db():
     db.create_all()
-
-
-@app.route("/")
+    #table rebuilds must not set off foreign key actions, SQLite only takes this pragma outside a transaction so it comes first
+    connection = db.session.connection().connection.dbapi_connection
+    connection.execute('PRAGMA foreign_keys=OFF')
+    schema = SchemaVersion.query.first()
+    if schema is None:
+        schema = SchemaVersion(version=0)
+        db.session.add(schema)
+    for version, description, statements in MIGRATIONS:
+        if version <= schema.version:
+            continue
+        for statement in statements:
+            if callable(statement):
+                statement(db.session)
+            else:
+                db.session.execute(text(statement))
+        schema.version = version
+        current_app.logger.info('Applied migration %s: %s', version, description)
+    version = schema.version
+    db.session.commit()
+    connection.execute('PRAGMA foreign_keys=ON')
+    violations = db.session.execute(text('PRAGMA foreign_key_check')).all()
+    if violations:
+        raise RuntimeError('Rows pointing at missing parents after the upgrade: %s' % violations[:10])
+    return version
+
+
+@bp.route("/")
 def home():
     return render_template('index.html')
 
-@app.route("/register/<user_type>", methods=['GET', 'POST'])
+@bp.route("/register/<user_type>", methods=['GET', 'POST'])
 def register(user_type):
     if request.method == 'POST':
         name = request.form.get('name')
         username = request.form.get('username')
         email = request.form.get('email')
         password = request.form.get('password')
-        hashed_password = generate_password_hash(password, salt_length = 16)
         user_name_exist = User.query.filter_by(username=username).first()
         if user_name_exist:
             flash('This username already exists. Please use other username.', 'danger')
@@ -98,6 +891,13 @@ def register(user_type):
         if email_exist:
             flash('This username already exists. Please use other username.', 'danger')
             return render_template('register.html', user_type = user_type)
+        #hashed on the password pool once the form is known to be usable, without holding a pooled connection meanwhile
+        db.session.rollback()
+        try:
+            hashed_password = password_hasher().hash(password)
+        except HasherBusy:
+            flash('Too many people are signing up right now, please try again in a moment.', 'danger')
+            return render_template('register.html', user_type = user_type), 503
         
         if user_type == "admin":
             user = User(name = name, username=username, email=email, password=hashed_password, is_admin = True )
@@ -114,18 +914,31 @@ def register(user_type):
         db.session.add(user)
         db.session.commit()
         flash('Your account has been created!', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     return render_template('register.html', user_type = user_type)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
-
-        if user and check_password_hash(user.password, password):
+        #the connection goes back to the pool before the slow hash, waiting logins would otherwise hold the ones other views need
+        if user:
+            db.session.expunge(user)
+        db.session.rollback()
+        try:
+            valid, new_hash = password_hasher().verify_and_update(user.password, password) if user else (False, None)
+        except HasherBusy:
+            flash('Too many people are logging in right now, please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+
+        if valid:
+            #stored with an older method or cost, swap in a hash made with the current settings
+            if new_hash:
+                db.session.execute(db.update(User).where(User.id == user.id).values(password=new_hash))
+                db.session.commit()
             session['user_id'] = user.id
             session['is_admin'] = user.is_admin
             session['is_sponsor'] = user.is_sponsor
@@ -145,37 +958,37 @@ def login():
 
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.pop('user_id', None)
     session.pop('is_admin', None)
     session.pop('is_sponsor', None)
     session.pop('is_influencer', None)
     flash('You have been logged out.', 'success')
-    return redirect(url_for('login'))
+    return redirect(url_for('.login'))
 
 
-@app.route('/<user_type>/dashboard', methods=['GET', 'POST'])
+@bp.route('/<user_type>/dashboard', methods=['GET', 'POST'])
 def dashboard(user_type):
     if request.method == "GET":
         if 'user_id' in session:
             if user_type=="admin" and session["is_admin"]:
-                ongoing_campaigns = Campaign.query.join(User).filter(Campaign.status_camp=='ongoing').all()
-                all_users = User.query.all()
-                all_campaigns = Campaign.query.join(User).all()
-                all_ad_reqs = AdRequest.query.join(Campaign).all()
-                return render_template(user_type + '_dashboard.html', ongoing_campaigns=ongoing_campaigns, all_users=all_users, all_campaigns=all_campaigns, all_ad_reqs = all_ad_reqs)
+                #each table is paginated on its own and relationships used by the template are loaded in bulk
+                #details are fetched by the modal from the JSON API only when the admin opens one
+                per_page = current_app.config['ADMIN_PAGE_SIZE']
+                users_page = db.paginate(db.select(User).order_by(User.id), page=request.args.get('users_page', 1, type=int), per_page=per_page, error_out=False)
+                #campaigns marked deleted and their ad requests are hidden until the purge removes them, like everywhere else
+                campaigns_page = db.paginate(db.select(Campaign).filter(Campaign.status_camp != DELETED_CAMPAIGN_STATUS).order_by(Campaign.id), page=request.args.get('campaigns_page', 1, type=int), per_page=per_page, error_out=False)
+                ad_reqs_page = db.paginate(db.select(AdRequest).join(AdRequest.campaign).filter(Campaign.status_camp != DELETED_CAMPAIGN_STATUS).options(contains_eager(AdRequest.campaign)).order_by(AdRequest.id), page=request.args.get('ad_reqs_page', 1, type=int), per_page=per_page, error_out=False)
+                ongoing_campaigns = [campaign for campaign in campaigns_page.items if campaign.status_camp == 'ongoing']
+                return render_template(user_type + '_dashboard.html', ongoing_campaigns=ongoing_campaigns, users_page=users_page, campaigns_page=campaigns_page, ad_reqs_page=ad_reqs_page, stats=platform_stats())
  
             if user_type=="sponsor" and session["is_sponsor"]:
-                ongoing_campaigns = Campaign.query.filter(Campaign.status_camp=='ongoing',Campaign.sponsor_id==session["user_id"]).all()
-                received_ad_requests = AdRequest.query.filter((AdRequest.created_by == 'influencer') & (AdRequest.status_adreq == 'pending') & (AdRequest.campaign_id == Campaign.id) & (Campaign.sponsor_id == session["user_id"])).all()
-                return render_template(user_type + '_dashboard.html', ongoing_campaigns=ongoing_campaigns, ad_requests=received_ad_requests)
-            ad_requests=[]
+                data = cached_dashboard('dashboard:sponsor:%s' % session["user_id"], session["user_id"], lambda: sponsor_dashboard_data(session["user_id"]))
+                return render_template(user_type + '_dashboard.html', **data)
             if user_type=="influencer" and session["is_influencer"]:
-                influencer = User.query.filter(User.id == session["user_id"]).first()
-                ongoing_campaigns = Campaign.query.join(Campaign.ad_requests).filter(Campaign.status_camp == 'ongoing',AdRequest.influencer_id == session["user_id"],AdRequest.status_adreq == 'accepted').distinct(Campaign.id).all()
-                ad_requests = AdRequest.query.join(Campaign).filter(Campaign.status_camp == 'ongoing',AdRequest.influencer_id == session["user_id"],AdRequest.status_adreq == 'pending', AdRequest.created_by=="sponsor").all()
-                return render_template(user_type + '_dashboard.html', ongoing_campaigns=ongoing_campaigns, ad_requests=ad_requests, influencer=influencer)
+                data = cached_dashboard('dashboard:influencer:%s' % session["user_id"], session["user_id"], lambda: influencer_dashboard_data(session["user_id"]))
+                return render_template(user_type + '_dashboard.html', **data)
             flash('Invalid user', 'danger')
             return redirect('/login')
         flash('Please login first', 'danger')
@@ -185,28 +998,28 @@ def dashboard(user_type):
 
 
 
-@app.route("/<user_type>/campaigns", methods=['GET', 'POST'])
+@bp.route("/<user_type>/campaigns", methods=['GET', 'POST'])
 def campaigns(user_type):
     if request.method == "GET":
         if 'user_id' in session:
             if user_type=="sponsor" and session["is_sponsor"]:
-                campaigns = Campaign.query.filter(Campaign.sponsor_id==session["user_id"]).all()
+                campaigns = Campaign.query.filter(Campaign.sponsor_id==session["user_id"], Campaign.status_camp != DELETED_CAMPAIGN_STATUS).all()
                 return render_template(user_type + '_campaigns.html', campaigns=campaigns)
             if user_type=="influencer" and session["is_influencer"]:
-                search_query=request.args.get('search_query')
-                if search_query:
-                    search_filter = f"%{search_query}%"
-                    public_campaigns = Campaign.query.filter(Campaign.visibility=="public", (Campaign.name.ilike(search_filter) | Campaign.description.ilike(search_filter) | Campaign.goals.ilike(search_filter))).all()
+                search_query=request.args.get('search_query', '')
+                if fts_query(search_query):
+                    public_campaigns = search_campaigns(search_query)
                 else:
-                    public_campaigns = Campaign.query.filter(Campaign.status_camp == 'ongoing',Campaign.visibility == 'public').all()  
-                return render_template(user_type + '_campaigns.html', campaigns=public_campaigns)
+                    public_campaigns = db.select(Campaign).filter(Campaign.status_camp == 'ongoing',Campaign.visibility == 'public').order_by(Campaign.id.desc())
+                campaigns_page = db.paginate(public_campaigns, page=request.args.get('page', 1, type=int), per_page=current_app.config['CAMPAIGNS_PAGE_SIZE'], error_out=False)
+                return render_template(user_type + '_campaigns.html', campaigns=campaigns_page.items, campaigns_page=campaigns_page, search_query=search_query)
             flash('Invalid user', 'danger')
             return redirect('/login')
         flash('Please login first', 'danger')
         return redirect('/login')
 
 
-@app.route("/sponsor/create_campaign", methods=['GET', 'POST'])
+@bp.route("/sponsor/create_campaign", methods=['GET', 'POST'])
 def create_campaign():
     if request.method == "GET":
         if 'user_id' in session:
@@ -230,6 +1043,7 @@ def create_campaign():
                 campaign = Campaign(name=name, description=description, end_date=end_date_obj, budget=budget,sponsor_id=sponsor_id, visibility=visibility, goals=goals)
                 db.session.add(campaign)
                 db.session.commit()
+                invalidate_dashboards(sponsor_ids=[sponsor_id])
                 flash('Your campaign has been created!', 'success')
                 return redirect("/sponsor/campaigns")
             flash('Invalid user', 'danger')
@@ -238,18 +1052,20 @@ def create_campaign():
         return redirect('/login')
 
 
-@app.route("/<user_type>/campaigns/<int:campaign_id>", methods=['GET', 'POST'])
+@bp.route("/<user_type>/campaigns/<int:campaign_id>", methods=['GET', 'POST'])
 def campaign(user_type, campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if user_type=="sponsor" and session["is_sponsor"]:
-                campaign = Campaign.query.get_or_404(campaign_id)
-                ad_requests = AdRequest.query.filter(AdRequest.campaign_id==campaign_id).all()
-                return render_template(user_type + '_view_campaign.html', campaign=campaign, ad_requests=ad_requests)
+                campaign = get_campaign_or_404(campaign_id)
+                filters = [AdRequest.campaign_id==campaign_id]
+                return versioned_response([campaign], lambda: render_template(user_type + '_view_campaign.html', campaign=campaign, ad_requests=AdRequest.query.filter(*filters).all()),
+                                          ad_requests_version(*filters))
             if user_type=="influencer" and session["is_influencer"]:
-                campaign = Campaign.query.get_or_404(campaign_id)
-                ad_requests = AdRequest.query.filter(AdRequest.campaign_id==campaign_id, AdRequest.influencer_id==session["user_id"]).all()
-                return render_template(user_type + '_view_campaign.html', campaign=campaign, ad_requests=ad_requests)
+                campaign = get_campaign_or_404(campaign_id)
+                filters = [AdRequest.campaign_id==campaign_id, AdRequest.influencer_id==session["user_id"]]
+                return versioned_response([campaign], lambda: render_template(user_type + '_view_campaign.html', campaign=campaign, ad_requests=AdRequest.query.filter(*filters).all()),
+                                          ad_requests_version(*filters))
             flash('Invalid user', 'danger')
             return redirect('/login')
         flash('Please login first', 'danger')
@@ -258,12 +1074,12 @@ def campaign(user_type, campaign_id):
 
 
 #creating a route to edit the created campaign by the sponsor
-@app.route("/sponsor/campaigns/<int:campaign_id>/edit", methods=['GET', 'POST'])
+@bp.route("/sponsor/campaigns/<int:campaign_id>/edit", methods=['GET', 'POST'])
 def campaign_edit(campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_sponsor"]:
-                campaign = Campaign.query.get_or_404(campaign_id)
+                campaign = get_campaign_or_404(campaign_id)
                 return render_template('edit_campaign.html', campaign=campaign)
             flash('Invalid user', 'danger')
             return redirect('/login')
@@ -279,7 +1095,7 @@ def campaign_edit(campaign_id):
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
                 visibility = request.form.get('visibility')
                 goals = request.form.get('goals')
-                campaign = Campaign.query.get_or_404(campaign_id)
+                campaign = get_campaign_or_404(campaign_id)
                 campaign.name = name
                 campaign.description = description
                 campaign.end_date = end_date_obj
@@ -287,6 +1103,7 @@ def campaign_edit(campaign_id):
                 campaign.visibility = visibility
                 campaign.goals = goals
                 db.session.commit()
+                invalidate_campaign_dashboards(campaign_id, campaign.sponsor_id)
                 flash('Your campaign has been updated', 'success')
                 return redirect("/sponsor/campaigns")
             flash('Invalid user', 'danger')
@@ -296,14 +1113,25 @@ def campaign_edit(campaign_id):
 
 
 #creating a route to delete the campaign created by the sponsor
-@app.route("/sponsor/campaigns/<int:campaign_id>/delete", methods=['GET', 'POST'])
+@bp.route("/sponsor/campaigns/<int:campaign_id>/delete", methods=['GET', 'POST'])
 def campaign_delete(campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_sponsor"]:
-                campaign = Campaign.query.get_or_404(campaign_id)
-                db.session.delete(campaign)
-                db.session.commit()
+                campaign = get_campaign_or_404(campaign_id)
+                influencer_ids = db.session.execute(db.select(AdRequest.influencer_id).filter(AdRequest.campaign_id == campaign_id).distinct()).scalars().all()
+                inline_max = current_app.config['PURGE_INLINE_MAX']
+                ad_requests = db.session.execute(db.select(func.count()).select_from(db.select(AdRequest.id).filter(AdRequest.campaign_id == campaign_id).limit(inline_max + 1).subquery())).scalar()
+                if ad_requests > inline_max:
+                    #too many ad requests to remove inside this request, the campaign is hidden now and purged in batches after the response
+                    campaign.status_camp = DELETED_CAMPAIGN_STATUS
+                    db.session.commit()
+                    start_purge(current_app._get_current_object())
+                else:
+                    #one DELETE, its ad requests go with it through ON DELETE CASCADE
+                    db.session.delete(campaign)
+                    db.session.commit()
+                invalidate_dashboards(sponsor_ids=[campaign.sponsor_id], influencer_ids=influencer_ids)
                 flash('Your campaign has been deleted', 'success')
                 return redirect("/sponsor/campaigns")
             flash('Invalid user', 'danger')
@@ -313,13 +1141,13 @@ def campaign_delete(campaign_id):
     
 
 #creating a route to create ad requests inside a particular campaign by the sponsor
-@app.route("/sponsor/campaigns/<int:campaign_id>/create_adrequest", methods=['GET', 'POST'])
+@bp.route("/sponsor/campaigns/<int:campaign_id>/create_adrequest", methods=['GET', 'POST'])
 def create_adrequest(campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_sponsor"]:
-                influencers = User.query.filter_by(is_influencer=True).all()
-                return render_template('create_adrequest.html', campaign_id=campaign_id,influencers=influencers)
+                get_own_campaign_or_404(campaign_id)
+                return render_template('create_adrequest.html', campaign_id=campaign_id)
             flash('Invalid user', 'danger')
             return redirect('/login')
         flash('Please login first', 'danger')
@@ -327,14 +1155,21 @@ def create_adrequest(campaign_id):
     if request.method=="POST":
         if 'user_id' in session:
             if session["is_sponsor"]:
-                influencer_name = request.form.get("influencer_name")
-                influencer_id = User.query.filter_by(name=influencer_name).first().id
+                get_own_campaign_or_404(campaign_id)
+                influencer_id = request.form.get("influencer_id", type=int)
+                influencer = db.session.get(User, influencer_id) if influencer_id else None
+                if influencer is None or not influencer.is_influencer:
+                    flash('Please pick an influencer from the suggestions', 'danger')
+                    return redirect("/sponsor/campaigns/"+str(campaign_id)+"/create_adrequest")
                 messages = request.form.get('messages')
                 requirements = request.form.get('requirements')
                 payment_amount = request.form.get('payment_amount')
                 ad_request = AdRequest(campaign_id = campaign_id, influencer_id=influencer_id, messages=messages, requirements=requirements, payment_amount=payment_amount)
                 db.session.add(ad_request)
-                db.session.commit()
+                if not commit_pending_ad_request():
+                    flash('This influencer already has a pending ad request for the campaign', 'danger')
+                    return redirect("/sponsor/campaigns/"+str(campaign_id)+"/adrequests")
+                invalidate_ad_request_dashboards([campaign_id], [influencer_id])
                 flash('Your ad request has been created and sent to selected influencer', 'success')
                 return redirect("/sponsor/campaigns/"+str(campaign_id)+"/adrequests")
             flash('Invalid user', 'danger')
@@ -343,13 +1178,143 @@ def create_adrequest(campaign_id):
         return redirect('/login')
 
 
+#creates one pending ad request per influencer in a single transaction and reports what happened to each one
+#ids that are not influencers or already have a pending request for the campaign are skipped
+#the unique pending index decides which rows go in, so a request sent by anyone between the lookup and the insert is skipped, not doubled
+def send_bulk_ad_requests(campaign_id, influencer_ids, messages, requirements, payment_amount):
+    influencer_ids = list(dict.fromkeys(influencer_ids))
+    valid_ids = set(db.session.execute(db.select(User.id).filter(User.id.in_(influencer_ids), User.is_influencer == True)).scalars())
+    rows = [dict(campaign_id=campaign_id, influencer_id=influencer_id, messages=messages, requirements=requirements,
+                 payment_amount=payment_amount, created_by='sponsor', status_adreq='pending')
+            for influencer_id in influencer_ids if influencer_id in valid_ids]
+    sent_ids = set()
+    if rows:
+        statement = (sqlite_insert(AdRequest).on_conflict_do_nothing(index_elements=['campaign_id', 'influencer_id'], index_where=AdRequest.status_adreq == 'pending')
+                     .returning(AdRequest.influencer_id))
+        sent_ids = set(db.session.execute(statement, rows).scalars())
+    db.session.commit()
+    results = {}
+    for influencer_id in influencer_ids:
+        if influencer_id not in valid_ids:
+            results[influencer_id] = 'not_influencer'
+        elif influencer_id in sent_ids:
+            results[influencer_id] = 'sent'
+        else:
+            results[influencer_id] = 'already_pending'
+    invalidate_ad_request_dashboards([campaign_id], list(sent_ids))
+    return results
+
+
+#directory filters a bulk ad request may pick influencers by, with the type each value is coerced to
+BULK_ADREQUEST_FILTERS = {'search_query': str, 'category': str, 'niche': str, 'reach_min': int, 'reach_max': int}
+
+
+#a whole number from a JSON number or a form/JSON string of digits, booleans are not numbers here
+def whole_number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('%s must be a whole number' % name)
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('%s must be a whole number' % name)
+
+
+#reads and checks the bulk ad request body, JSON or form
+#returns (influencer ids, search filters or None, messages, requirements, payment amount), raises ValueError with the message for a 400
+def bulk_adrequest_fields():
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError('Send a JSON object')
+        influencer_ids = data.get('influencer_ids', [])
+        if not isinstance(influencer_ids, list) or any(isinstance(i, bool) or not isinstance(i, int) for i in influencer_ids):
+            raise ValueError('influencer_ids must be a list of integers')
+        filters = data.get('filters')
+        if filters is not None:
+            if not isinstance(filters, dict):
+                raise ValueError('filters must be an object')
+            unknown = sorted(set(filters) - set(BULK_ADREQUEST_FILTERS))
+            if unknown:
+                raise ValueError('Unknown filters: %s' % ', '.join(unknown))
+            for name, value in list(filters.items()):
+                if value is None or value == '':
+                    filters[name] = '' if name == 'search_query' else None
+                elif BULK_ADREQUEST_FILTERS[name] is int:
+                    filters[name] = whole_number(value, name)
+                elif isinstance(value, str):
+                    filters[name] = value
+                else:
+                    raise ValueError('%s must be a string' % name)
+    else:
+        data = request.form
+        influencer_ids = [int(influencer_id) for influencer_id in re.findall(r'\d+', ' '.join(data.getlist('influencer_ids')))]
+        filters = None
+        if data.get('use_filters'):
+            filters = dict(search_query=data.get('search_query', ''), category=data.get('category') or None,
+                           niche=data.get('niche') or None, reach_min=data.get('reach_min', type=int),
+                           reach_max=data.get('reach_max', type=int))
+    messages = data.get('messages')
+    if messages is not None and not isinstance(messages, str):
+        raise ValueError('messages must be a string')
+    requirements = data.get('requirements')
+    if not isinstance(requirements, str) or not requirements.strip():
+        raise ValueError('requirements is required')
+    if data.get('payment_amount') in (None, ''):
+        raise ValueError('payment_amount is required')
+    payment_amount = whole_number(data.get('payment_amount'), 'payment_amount')
+    if payment_amount < 0:
+        raise ValueError('payment_amount must not be negative')
+    return influencer_ids, filters, messages, requirements, payment_amount
+
+
+#creating a route to send the same ad request to many influencers of a campaign at once, picked by id or by directory filters
+@bp.route("/sponsor/campaigns/<int:campaign_id>/bulk_adrequest", methods=['GET', 'POST'])
+def bulk_adrequest(campaign_id):
+    if 'user_id' not in session:
+        if request.is_json:
+            return jsonify(error='Please login first'), 401
+        flash('Please login first', 'danger')
+        return redirect('/login')
+    if not session["is_sponsor"]:
+        if request.is_json:
+            return jsonify(error='Invalid user'), 403
+        flash('Invalid user', 'danger')
+        return redirect('/login')
+    campaign = get_own_campaign_or_404(campaign_id)
+    if request.method == "GET":
+        return render_template('bulk_adrequest.html', campaign=campaign, results=None)
+    try:
+        influencer_ids, filters, messages, requirements, payment_amount = bulk_adrequest_fields()
+    except ValueError as e:
+        if request.is_json:
+            return jsonify(error=str(e)), 400
+        flash(str(e), 'danger')
+        return render_template('bulk_adrequest.html', campaign=campaign, results=None)
+    if filters:
+        matching = search_influencers(**filters).with_only_columns(User.id).order_by(None).limit(current_app.config['BULK_ADREQUEST_MAX'] + 1)
+        influencer_ids += db.session.execute(matching).scalars().all()
+    if not influencer_ids or len(set(influencer_ids)) > current_app.config['BULK_ADREQUEST_MAX']:
+        message = 'Pick between 1 and %d influencers' % current_app.config['BULK_ADREQUEST_MAX']
+        if request.is_json:
+            return jsonify(error=message), 400
+        flash(message, 'danger')
+        return render_template('bulk_adrequest.html', campaign=campaign, results=None)
+    results = send_bulk_ad_requests(campaign_id, influencer_ids, messages, requirements, payment_amount)
+    if request.is_json:
+        return jsonify(campaign_id=campaign_id, sent=list(results.values()).count('sent'), results=results)
+    flash('Your ad request has been sent to %d influencers' % list(results.values()).count('sent'), 'success')
+    return render_template('bulk_adrequest.html', campaign=campaign, results=results)
+
+
 #creating a route to view the ad requests created by the sponsor inside a particular campaign
-@app.route("/sponsor/campaigns/<int:campaign_id>/adrequests", methods=['GET', 'POST'])
+@bp.route("/sponsor/campaigns/<int:campaign_id>/adrequests", methods=['GET', 'POST'])
 def adrequests(campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_sponsor"]:
-                ad_requests = AdRequest.query.join(AdRequest.influencer).filter(AdRequest.campaign_id == campaign_id).all()
+                get_own_campaign_or_404(campaign_id)
+                ad_requests = (AdRequest.query.join(AdRequest.influencer).join(AdRequest.campaign)
+                               .filter(AdRequest.campaign_id == campaign_id, Campaign.status_camp != DELETED_CAMPAIGN_STATUS).all())
                 return render_template('all_adrequests.html', ad_requests=ad_requests, campaign_id=campaign_id)
             flash('Invalid user', 'danger')
             return redirect('/login')
@@ -357,7 +1322,7 @@ def adrequests(campaign_id):
         return redirect('/login')
     
 #creating a route to edit the ad requests created by the sponsor inside a particular campaign
-@app.route("/sponsor/campaigns/<int:campaign_id>/adrequests/<int:ad_request_id>/edit", methods=['GET', 'POST'])
+@bp.route("/sponsor/campaigns/<int:campaign_id>/adrequests/<int:ad_request_id>/edit", methods=['GET', 'POST'])
 def adrequest_edit(campaign_id, ad_request_id):
     if request.method == "GET":
         if 'user_id' in session:
@@ -381,6 +1346,7 @@ def adrequest_edit(campaign_id, ad_request_id):
                 ad_request.requirements = requirements
                 ad_request.payment_amount = payment_amount
                 db.session.commit()
+                invalidate_ad_request_dashboards([ad_request.campaign_id], [ad_request.influencer_id])
                 flash('Your ad request has been updated', 'success')
                 return redirect("/sponsor/campaigns/" + str(campaign_id)+"/adrequests")
             flash('Invalid user', 'danger')
@@ -390,7 +1356,7 @@ def adrequest_edit(campaign_id, ad_request_id):
     
 
 #creating app route to delete an ad request created by sponsor inside a particular campaign
-@app.route("/sponsor/campaigns/<int:campaign_id>/adrequests/<int:ad_request_id>/delete", methods=['GET', 'POST'])
+@bp.route("/sponsor/campaigns/<int:campaign_id>/adrequests/<int:ad_request_id>/delete", methods=['GET', 'POST'])
 def adrequest_delete(campaign_id, ad_request_id):
     if request.method == "GET":
         if 'user_id' in session:
@@ -398,6 +1364,7 @@ def adrequest_delete(campaign_id, ad_request_id):
                 ad_request = AdRequest.query.get_or_404(ad_request_id)
                 db.session.delete(ad_request)
                 db.session.commit()
+                invalidate_ad_request_dashboards([ad_request.campaign_id], [ad_request.influencer_id])
                 flash('Your ad request has been deleted', 'success')
                 return redirect("/sponsor/campaigns/" + str(campaign_id)+"/adrequests")
             flash('Invalid user', 'danger')
@@ -407,93 +1374,143 @@ def adrequest_delete(campaign_id, ad_request_id):
     
 
 
-#create route to accept an ad request by the influencer
-@app.route("/adrequests/<int:ad_request_id>/accept", methods=['GET', 'POST'])
-def adrequest_accept(ad_request_id):
-    if request.method == "GET":
-        if 'user_id' in session:
-            if session["is_influencer"]:
-                ad_request = AdRequest.query.get_or_404(ad_request_id)
-                if ad_request.influencer_id == session["user_id"]:
-                    ad_request.status_adreq = "accepted"
-                    db.session.commit()
-                    flash('Your have successfully accepted the ad request', 'success')
-                    return redirect("/influencer/dashboard")
-                flash('Invalid user', 'danger')
-                return redirect('/login')
-            if session["is_sponsor"]:
-                ad_request = AdRequest.query.get_or_404(ad_request_id)
-                if ad_request.created_by == "influencer":
-                    ad_request.status_adreq = "accepted"
-                    db.session.commit()
-                    flash('Your have successfully accepted the ad request', 'success')
-                    return redirect("/sponsor/campaigns")
-                flash('Request not sent by Influencer', 'danger')
-                return redirect('/login')
-            flash('Invalid user', 'danger')
-            return redirect('/login')
-        flash('Please login first', 'danger')
+#moves pending ad requests to accepted/rejected with one conditional UPDATE and returns how many rows changed
+#RETURNING hands back the changed rows so only the dashboards they appear on are invalidated
+#influencers may answer requests addressed to them, sponsors may answer requests influencers sent to their campaigns
+#a request that is no longer pending or belongs to someone else is left untouched, so concurrent clicks cannot both win
+def set_ad_requests_status(ad_request_ids, status_adreq):
+    if session["is_influencer"]:
+        owned = AdRequest.influencer_id == session["user_id"]
+    else:
+        owned = (AdRequest.created_by == 'influencer') & AdRequest.campaign_id.in_(db.select(Campaign.id).filter(Campaign.sponsor_id == session["user_id"]))
+    result = db.session.execute(db.update(AdRequest)
+                                .where(AdRequest.id.in_(ad_request_ids), AdRequest.status_adreq == 'pending', owned)
+                                .values(status_adreq=status_adreq)
+                                .returning(AdRequest.campaign_id, AdRequest.influencer_id)
+                                .execution_options(synchronize_session=False)).all()
+    db.session.commit()
+    if result:
+        invalidate_ad_request_dashboards([row.campaign_id for row in result], [row.influencer_id for row in result])
+    return len(result)
+
+
+def answer_ad_request(ad_request_id, status_adreq):
+    if 'user_id' in session:
+        if session["is_influencer"] or session["is_sponsor"]:
+            next_page = "/influencer/dashboard" if session["is_influencer"] else "/sponsor/campaigns"
+            if set_ad_requests_status([ad_request_id], status_adreq):
+                flash('You have successfully ' + status_adreq + ' the ad request', 'success')
+            else:
+                flash('This ad request is no longer pending or cannot be answered by you', 'danger')
+            return redirect(next_page)
+        flash('Invalid user', 'danger')
         return redirect('/login')
+    flash('Please login first', 'danger')
+    return redirect('/login')
+
 
+#create route to accept an ad request by the influencer
+@bp.route("/adrequests/<int:ad_request_id>/accept", methods=['GET', 'POST'])
+def adrequest_accept(ad_request_id):
+    return answer_ad_request(ad_request_id, "accepted")
 
 
-@app.route("/adrequests/<int:ad_request_id>/reject", methods=['GET', 'POST'])
+@bp.route("/adrequests/<int:ad_request_id>/reject", methods=['GET', 'POST'])
 def adrequest_reject(ad_request_id):
-    if request.method == "GET":
-        if 'user_id' in session:
-            if session["is_influencer"]:
-                ad_request = AdRequest.query.get_or_404(ad_request_id)
-                if ad_request.influencer_id == session["user_id"]:
-                    ad_request.status_adreq = "rejected"
-                    db.session.commit()
-                    flash('Your have successfully accepted the ad request', 'success')
-                    return redirect("/influencer/dashboard")
-                flash('Invalid user', 'danger')
-                return redirect('/login')
-            if session["is_sponsor"]:
-                ad_request = AdRequest.query.get_or_404(ad_request_id)
-                if ad_request.created_by == "influencer":
-                    ad_request.status_adreq = "rejected"
-                    db.session.commit()
-                    flash('Your have successfully accepted the ad request', 'success')
-                    return redirect("/sponsor/campaigns")
-                flash('Request not sent by Influencer', 'danger')
-                return redirect('/login')
-            flash('Invalid user', 'danger')
-            return redirect('/login')
+    return answer_ad_request(ad_request_id, "rejected")
+
+
+#reads and checks the body of a bulk accept or reject, JSON or form
+#returns (action, ad request ids), raises ValueError with the message for a 400
+def adrequests_bulk_fields():
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError('Send a JSON object')
+        ad_request_ids = data.get('ad_request_ids', [])
+        if not isinstance(ad_request_ids, list) or any(isinstance(i, bool) or not isinstance(i, int) for i in ad_request_ids):
+            raise ValueError('ad_request_ids must be a list of integers')
+    else:
+        data = request.form
+        ad_request_ids = data.getlist('ad_request_ids', type=int)
+    action = data.get('action')
+    if action not in ('accept', 'reject'):
+        raise ValueError('action must be accept or reject')
+    if not ad_request_ids or len(set(ad_request_ids)) > current_app.config['BULK_ADREQUEST_MAX']:
+        raise ValueError('Select between 1 and %d ad requests' % current_app.config['BULK_ADREQUEST_MAX'])
+    return action, ad_request_ids
+
+
+#create route to accept or reject many ad requests at once from the dashboards
+@bp.route("/adrequests/bulk", methods=['POST'])
+def adrequests_bulk():
+    if 'user_id' not in session or not (session["is_influencer"] or session["is_sponsor"]):
+        if request.is_json:
+            return jsonify(error='Please login first'), 401
         flash('Please login first', 'danger')
         return redirect('/login')
+    try:
+        action, ad_request_ids = adrequests_bulk_fields()
+    except ValueError as e:
+        if request.is_json:
+            return jsonify(error=str(e)), 400
+        flash(str(e), 'danger')
+        return redirect(request.referrer or '/login')
+    updated = set_ad_requests_status(ad_request_ids, action + 'ed')
+    if request.is_json:
+        return jsonify(action=action, requested=len(ad_request_ids), updated=updated)
+    flash('%d of %d ad requests %sed' % (updated, len(ad_request_ids), action), 'success' if updated == len(ad_request_ids) else 'warning')
+    return redirect("/influencer/dashboard" if session["is_influencer"] else "/sponsor/dashboard")
 
 
 
 
 #create a route to view all the influencers by the sponsor
-@app.route("/sponsor/influencers", methods=['GET'])
+@bp.route("/sponsor/influencers", methods=['GET'])
 def view_influencers():
     if 'user_id' in session:
         if session["is_sponsor"]:
-            search_query=request.args.get('search_query')
-            if search_query:
-                search_filter = f"%{search_query}%"
-                influencers = User.query.filter(User.is_influencer == True,(User.name.ilike(search_filter) | User.inf_category.ilike(search_filter) | User.inf_niche.ilike(search_filter))).all()
-            else:
-                influencers = User.query.filter_by(is_influencer=True).all()
-            return render_template('view_influencers.html', influencers=influencers)
+            filters = dict(search_query=request.args.get('search_query', ''),
+                           category=request.args.get('category') or None,
+                           niche=request.args.get('niche') or None,
+                           reach_min=request.args.get('reach_min', type=int),
+                           reach_max=request.args.get('reach_max', type=int))
+            influencers_page = db.paginate(search_influencers(**filters), page=request.args.get('page', 1, type=int), per_page=current_app.config['INFLUENCERS_PAGE_SIZE'], error_out=False)
+            category_counts = influencer_facet_counts(User.inf_category, search_influencers(skip_category=True, **filters))
+            niche_counts = influencer_facet_counts(User.inf_niche, search_influencers(skip_niche=True, **filters))
+            return render_template('view_influencers.html', influencers=influencers_page.items, influencers_page=influencers_page, filters=filters, category_counts=category_counts, niche_counts=niche_counts)
         flash('Invalid user', 'danger')
         return redirect('/login')
     flash('Please login first', 'danger')
     return redirect('/login')
 
 
+#create a route returning the best matching influencers for the typeahead on the ad request form
+@bp.route("/sponsor/influencers/typeahead", methods=['GET'])
+def influencer_typeahead():
+    if 'user_id' in session:
+        if session["is_sponsor"]:
+            limit = min(request.args.get('limit', current_app.config['TYPEAHEAD_LIMIT'], type=int), current_app.config['TYPEAHEAD_LIMIT'])
+            search_query = request.args.get('q', '')
+            if not search_query.strip():
+                return jsonify([])
+            influencers = db.session.execute(search_influencers(search_query).limit(limit)).scalars()
+            return jsonify([{'id': influencer.id, 'name': influencer.name, 'username': influencer.username,
+                             'category': influencer.inf_category, 'niche': influencer.inf_niche, 'reach': influencer.inf_reach}
+                            for influencer in influencers])
+        return jsonify(error='Invalid user'), 403
+    return jsonify(error='Please login first'), 401
+
+
 #create app route to view the profile of influencer by the sponsor
-@app.route("/sponsor/influencers/<int:influencer_id>", methods=['GET', 'POST'])
+@bp.route("/sponsor/influencers/<int:influencer_id>", methods=['GET', 'POST'])
 def influencer_profile(influencer_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_sponsor"]:
-                if User.query.get_or_404(influencer_id).is_influencer:
-                    influencer = User.query.get_or_404(influencer_id)
-                    return render_template('influencer_profile.html', influencer=influencer)
+                influencer = User.query.get_or_404(influencer_id)
+                if influencer.is_influencer:
+                    return versioned_response([influencer], lambda: render_template('influencer_profile.html', influencer=influencer))
                 flash('Invalid user', 'danger')
                 return redirect('/login')
             flash('Invalid user', 'danger')
@@ -505,11 +1522,12 @@ def influencer_profile(influencer_id):
 
 
 
-@app.route('/influencer/send_ad_request/<int:campaign_id>', methods=["GET",'POST'])
+@bp.route('/influencer/send_ad_request/<int:campaign_id>', methods=["GET",'POST'])
 def send_ad_request(campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_influencer"]:
+                get_campaign_or_404(campaign_id)
                 return render_template('send_adrequest.html', campaign_id=campaign_id)
             flash('Invalid user', 'danger')
             return redirect('/login')
@@ -517,14 +1535,18 @@ def send_ad_request(campaign_id):
         return redirect('/login')
     if request.method=="POST":
         if 'user_id' in session and session['is_influencer']:
+            get_campaign_or_404(campaign_id)
             messages = request.form.get('messages')
             requirements = request.form.get('requirements')
             payment_amount = request.form.get('payment_amount')
             new_ad_request = AdRequest(campaign_id=campaign_id,influencer_id=session['user_id'],messages=messages,requirements= requirements,payment_amount=payment_amount, created_by='influencer')
             db.session.add(new_ad_request)
-            db.session.commit()
+            if not commit_pending_ad_request():
+                flash('You already have a pending ad request for this campaign', 'danger')
+                return redirect(url_for('.dashboard', user_type='influencer'))
+            invalidate_ad_request_dashboards([campaign_id], [session['user_id']])
             flash('Ad request sent successfully', 'success')
-            return redirect(url_for('dashboard', user_type='influencer'))
+            return redirect(url_for('.dashboard', user_type='influencer'))
         flash('You need to be logged in as an influencer to send an ad request', 'danger')
         return redirect('/login')
 
@@ -532,13 +1554,13 @@ def send_ad_request(campaign_id):
 
 
 
-@app.route("/influencer/campaigns/<int:campaign_id>/adrequests", methods=['GET', 'POST'])
+@bp.route("/influencer/campaigns/<int:campaign_id>/adrequests", methods=['GET', 'POST'])
 def influencer_adrequests(campaign_id):
     if request.method == "GET":
         if 'user_id' in session:
             if session["is_influencer"]:
-                campaign_name = Campaign.query.get_or_404(campaign_id).name
-                ad_requests = AdRequest.query.join(AdRequest.campaign).filter(AdRequest.campaign_id == campaign_id,AdRequest.influencer_id == session["user_id"]).all()
+                campaign_name = get_campaign_or_404(campaign_id).name
+                ad_requests = AdRequest.query.join(AdRequest.campaign).filter(AdRequest.campaign_id == campaign_id,AdRequest.influencer_id == session["user_id"], Campaign.status_camp != DELETED_CAMPAIGN_STATUS).all()
                 return render_template('influencer_adrequests.html', ad_requests=ad_requests, campaign_id=campaign_id, campaign_name = campaign_name)
             flash('Invalid user', 'danger')
             return redirect('/login')
@@ -552,6 +1574,509 @@ def influencer_adrequests(campaign_id):
 
 
 
+EXPORT_COLUMNS = {
+    'users': [User.id, User.username, User.name, User.email, User.is_admin, User.is_sponsor, User.is_influencer,
+              User.sp_industry, User.sp_budget, User.inf_category, User.inf_niche, User.inf_reach],
+    'campaigns': [Campaign.id, Campaign.name, Campaign.description, Campaign.start_date, Campaign.end_date, Campaign.budget,
+                  Campaign.visibility, Campaign.goals, Campaign.status_camp, Campaign.sponsor_id],
+    'ad_requests': [AdRequest.id, AdRequest.campaign_id, AdRequest.influencer_id, AdRequest.messages, AdRequest.requirements,
+                    AdRequest.payment_amount, AdRequest.created_by, AdRequest.status_adreq],
+}
+
+
+#the export query for an entity with the dashboard filters applied: status, sponsor and a start date range
+#ad requests have no date of their own and are filtered on their campaign's start date
+def export_query(entity, args):
+    query = db.select(*EXPORT_COLUMNS[entity])
+    if entity == 'users':
+        role = args.get('role')
+        if role in ('admin', 'sponsor', 'influencer'):
+            query = query.filter(getattr(User, 'is_' + role) == True)
+        return query.order_by(User.id)
+    if entity == 'ad_requests':
+        query = query.join(Campaign, AdRequest.campaign_id == Campaign.id)
+        if args.get('status'):
+            query = query.filter(AdRequest.status_adreq == args.get('status'))
+    elif args.get('status'):
+        query = query.filter(Campaign.status_camp == args.get('status'))
+    if args.get('sponsor_id', type=int):
+        query = query.filter(Campaign.sponsor_id == args.get('sponsor_id', type=int))
+    if args.get('start_from'):
+        query = query.filter(Campaign.start_date >= datetime.strptime(args.get('start_from'), '%Y-%m-%d').date())
+    if args.get('start_to'):
+        query = query.filter(Campaign.start_date <= datetime.strptime(args.get('start_to'), '%Y-%m-%d').date())
+    return query.order_by(EXPORT_COLUMNS[entity][0])
+
+
+#yields the export a chunk of rows at a time so memory stays flat whatever the table size
+def export_rows(query, columns, file_format):
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    result = db.session.execute(query.execution_options(yield_per=chunk_size))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(columns)
+    for rows in result.partitions():
+        for row in rows:
+            if file_format == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=str) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+#create a route streaming users, campaigns or ad requests to admins as CSV or NDJSON
+@bp.route("/admin/export/<entity>.<file_format>", methods=['GET'])
+def admin_export(entity, file_format):
+    if 'user_id' in session:
+        if session["is_admin"]:
+            if entity not in EXPORT_COLUMNS or file_format not in ('csv', 'ndjson'):
+                abort(404)
+            try:
+                query = export_query(entity, request.args)
+            except ValueError:
+                abort(400)
+            columns = [column.key for column in EXPORT_COLUMNS[entity]]
+            mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+            return Response(stream_with_context(export_rows(query, columns, file_format)), mimetype=mimetype,
+                            headers={'Content-Disposition': 'attachment; filename=%s.%s' % (entity, file_format)})
+        flash('Invalid user', 'danger')
+        return redirect('/login')
+    flash('Please login first', 'danger')
+    return redirect('/login')
+
+
+#JSON body of a detail view, answered with 304 from the row versions alone when the browser already has it
+def detail_response(rows, build):
+    return versioned_response(rows, lambda: jsonify(build()))
+
+
+def campaign_detail(campaign):
+    return {'id': campaign.id, 'name': campaign.name, 'description': campaign.description,
+            'start_date': campaign.start_date.isoformat(), 'end_date': campaign.end_date.isoformat(),
+            'budget': campaign.budget, 'visibility': campaign.visibility, 'goals': campaign.goals,
+            'status_camp': campaign.status_camp, 'sponsor': campaign.sponsor.username}
+
+
+def user_detail(user):
+    return {'id': user.id, 'username': user.username, 'name': user.name, 'email': user.email,
+            'is_admin': user.is_admin, 'is_sponsor': user.is_sponsor, 'is_influencer': user.is_influencer,
+            'sp_industry': user.sp_industry, 'sp_budget': user.sp_budget, 'inf_category': user.inf_category,
+            'inf_niche': user.inf_niche, 'inf_reach': user.inf_reach}
+
+
+def ad_request_detail(ad_request):
+    return {'id': ad_request.id, 'campaign': ad_request.campaign.name, 'influencer': ad_request.influencer.username,
+            'messages': ad_request.messages, 'requirements': ad_request.requirements, 'payment_amount': ad_request.payment_amount,
+            'created_by': ad_request.created_by, 'status_adreq': ad_request.status_adreq}
+
+
+#create a route returning one campaign as JSON for the detail modals
+#public campaigns are visible to everyone logged in, private ones to admins, their sponsor and influencers with a request on them
+@bp.route("/api/campaigns/<int:campaign_id>", methods=['GET'])
+def api_campaign(campaign_id):
+    if 'user_id' not in session:
+        return jsonify(error='Please login first'), 401
+    campaign = get_campaign_or_404(campaign_id, options=[joinedload(Campaign.sponsor)])
+    allowed = (session["is_admin"] or campaign.visibility == 'public' or campaign.sponsor_id == session["user_id"]
+               or db.session.execute(db.select(AdRequest.id).filter_by(campaign_id=campaign_id, influencer_id=session["user_id"]).limit(1)).first())
+    if not allowed:
+        return jsonify(error='Invalid user'), 403
+    return detail_response([campaign, campaign.sponsor], lambda: campaign_detail(campaign))
+
+
+#create a route returning one user as JSON for the detail modals, admins see everyone, sponsors see influencers
+@bp.route("/api/users/<int:user_id>", methods=['GET'])
+def api_user(user_id):
+    if 'user_id' not in session:
+        return jsonify(error='Please login first'), 401
+    user = db.get_or_404(User, user_id)
+    if not (session["is_admin"] or user.id == session["user_id"] or (session["is_sponsor"] and user.is_influencer)):
+        return jsonify(error='Invalid user'), 403
+    return detail_response([user], lambda: user_detail(user))
+
+
+#create a route returning one ad request as JSON for the detail modals, visible to admins, its influencer and its campaign's sponsor
+@bp.route("/api/adrequests/<int:ad_request_id>", methods=['GET'])
+def api_ad_request(ad_request_id):
+    if 'user_id' not in session:
+        return jsonify(error='Please login first'), 401
+    ad_request = db.get_or_404(AdRequest, ad_request_id, options=[joinedload(AdRequest.campaign), joinedload(AdRequest.influencer)])
+    if not (session["is_admin"] or ad_request.influencer_id == session["user_id"] or ad_request.campaign.sponsor_id == session["user_id"]):
+        return jsonify(error='Invalid user'), 403
+    return detail_response([ad_request, ad_request.campaign, ad_request.influencer], lambda: ad_request_detail(ad_request))
+
+
+#the newest event of a user, dashboards start following their feed from here
+def latest_event_id(user_id):
+    return db.session.execute(db.select(func.max(Event.id)).filter(Event.user_id == user_id)).scalar() or 0
+
+
+#a user's events after the cursor, oldest first, read as a range of the (user_id, id) index so the cost grows with the new rows only
+def events_after(user_id, after, limit):
+    return db.session.execute(db.select(Event).filter(Event.user_id == user_id, Event.id > after).order_by(Event.id).limit(limit)).scalars().all()
+
+
+#true when events after the cursor may already have been pruned, the client has to reload the page instead of applying what is left
+def cursor_expired(after):
+    oldest = db.session.execute(db.select(func.min(Event.id))).scalar()
+    return bool(after and oldest and after < oldest - 1)
+
+
+def event_detail(event):
+    return {'id': event.id, 'kind': event.kind, 'campaign_id': event.campaign_id, 'ad_request_id': event.ad_request_id,
+            'status': event.status, 'created_at': event.created_at.isoformat()}
+
+
+#create a route returning the logged in user's events after the cursor in ?after, at most EVENTS_PAGE_SIZE of them
+#without a cursor it only returns the current one, reset tells the client its cursor is older than the events kept
+@bp.route("/events", methods=['GET'])
+def events():
+    if 'user_id' not in session:
+        return jsonify(error='Please login first'), 401
+    after = request.args.get('after', type=int)
+    if after is None or cursor_expired(after):
+        return jsonify(events=[], cursor=latest_event_id(session["user_id"]), more=False, reset=after is not None)
+    limit = current_app.config['EVENTS_PAGE_SIZE']
+    rows = events_after(session["user_id"], after, limit)
+    return jsonify(events=[event_detail(event) for event in rows], cursor=rows[-1].id if rows else after, more=len(rows) == limit, reset=False)
+
+
+#polls the event log every EVENTS_POLL_SECONDS and yields Server-Sent Events, each with its id so the browser resumes from Last-Event-ID
+#the session is closed between polls so an idle stream holds no database connection, and the stream ends after
+#EVENTS_STREAM_SECONDS to free the worker thread, the browser then reconnects on its own
+def event_stream(user_id, after):
+    config = current_app.config
+    deadline = time.monotonic() + config['EVENTS_STREAM_SECONDS']
+    yield 'retry: %d\n\n' % (config['EVENTS_POLL_SECONDS'] * 1000)
+    while True:
+        if cursor_expired(after):
+            db.session.close()
+            yield 'event: reset\ndata: {}\n\n'
+            return
+        rows = events_after(user_id, after, config['EVENTS_PAGE_SIZE'])
+        db.session.close()
+        for event in rows:
+            yield 'id: %d\ndata: %s\n\n' % (event.id, json.dumps(event_detail(event)))
+            after = event.id
+        if time.monotonic() >= deadline:
+            return
+        if not rows:
+            #a comment line keeps proxies from closing a quiet connection
+            yield ': keep-alive\n\n'
+            time.sleep(config['EVENTS_POLL_SECONDS'])
+
+
+#create a route streaming the logged in user's events as Server-Sent Events, switched off unless EVENTS_STREAM_SECONDS is set
+#each open stream keeps a worker thread busy, so it is meant for threaded or async servers; dashboards fall back to polling /events
+@bp.route("/events/stream", methods=['GET'])
+def events_stream():
+    if not current_app.config['EVENTS_STREAM_SECONDS']:
+        abort(404)
+    if 'user_id' not in session:
+        return jsonify(error='Please login first'), 401
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('after', type=int)
+    if after is None:
+        after = latest_event_id(session["user_id"])
+    return Response(stream_with_context(event_stream(session["user_id"], after)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+#create a route showing the hit/miss counters of the dashboard cache to admins
+@bp.route("/admin/cache_stats", methods=['GET'])
+def cache_stats():
+    if 'user_id' in session and session["is_admin"]:
+        return jsonify(dashboard_cache().stats())
+    return jsonify(error='Invalid user'), 403
+
+
+#the number of rows changed by one run of the lifecycle job
+LIFECYCLE_COUNTS = ('campaigns_completed', 'ad_requests_expired', 'feature_changes_pruned', 'ad_requests_purged', 'campaigns_purged', 'events_pruned')
+#campaign statuses whose pending ad requests can no longer be answered, listed so the lookup can use the status index
+FINISHED_CAMPAIGN_STATUSES = ('completed', 'cancelled')
+
+
+def expired_campaigns_query(today, batch_size):
+    return db.select(Campaign.id).filter(Campaign.status_camp == 'ongoing', Campaign.end_date < today).limit(batch_size)
+
+
+def stale_ad_requests_query(batch_size):
+    return (db.select(AdRequest.id).join(Campaign, AdRequest.campaign_id == Campaign.id)
+            .filter(Campaign.status_camp.in_(FINISHED_CAMPAIGN_STATUSES), AdRequest.status_adreq == 'pending').limit(batch_size))
+
+
+#moves ongoing campaigns whose end date has passed to completed, then expires pending ad requests on every campaign that is no longer ongoing
+#each batch is one set-based UPDATE of at most LIFECYCLE_BATCH_SIZE rows in its own short transaction, so other writers never wait long
+def run_lifecycle(today=None, batch_size=None):
+    today = today or datetime.now().date()
+    batch_size = batch_size or current_app.config['LIFECYCLE_BATCH_SIZE']
+    counts = dict.fromkeys(LIFECYCLE_COUNTS, 0)
+    while True:
+        batch = expired_campaigns_query(today, batch_size)
+        campaigns = db.session.execute(db.update(Campaign).where(Campaign.id.in_(batch)).values(status_camp='completed')
+                                       .returning(Campaign.id, Campaign.sponsor_id).execution_options(synchronize_session=False)).all()
+        if not campaigns:
+            break
+        influencer_ids = db.session.execute(db.select(AdRequest.influencer_id).filter(AdRequest.campaign_id.in_([row.id for row in campaigns])).distinct()).scalars().all()
+        db.session.commit()
+        invalidate_dashboards(sponsor_ids=[row.sponsor_id for row in campaigns], influencer_ids=influencer_ids)
+        counts['campaigns_completed'] += len(campaigns)
+    while True:
+        batch = stale_ad_requests_query(batch_size)
+        ad_requests = db.session.execute(db.update(AdRequest).where(AdRequest.id.in_(batch)).values(status_adreq='expired')
+                                         .returning(AdRequest.campaign_id, AdRequest.influencer_id).execution_options(synchronize_session=False)).all()
+        if not ad_requests:
+            break
+        db.session.commit()
+        invalidate_ad_request_dashboards([row.campaign_id for row in ad_requests], [row.influencer_id for row in ad_requests])
+        counts['ad_requests_expired'] += len(ad_requests)
+    counts.update(purge_deleted(batch_size))
+    counts['events_pruned'] = prune_events(batch_size)
+    #workers that fall further behind than RECOMMEND_CHANGES_KEEP rows rebuild their recommendation matrix from scratch
+    counts['feature_changes_pruned'] = db.session.execute(text("DELETE FROM influencer_feature_changes WHERE seq <= (SELECT MAX(seq) FROM influencer_feature_changes) - :keep"),
+                                                          {'keep': current_app.config['RECOMMEND_CHANGES_KEEP']}).rowcount
+    db.session.commit()
+    return counts
+
+
+def deleted_ad_requests_query(batch_size):
+    return (db.select(AdRequest.id).join(Campaign, AdRequest.campaign_id == Campaign.id)
+            .filter(Campaign.status_camp == DELETED_CAMPAIGN_STATUS).limit(batch_size))
+
+
+def deleted_campaigns_query(batch_size):
+    return (db.select(Campaign.id).filter(Campaign.status_camp == DELETED_CAMPAIGN_STATUS, ~Campaign.ad_requests.any())
+            .limit(batch_size))
+
+
+#removes campaigns marked deleted, first their ad requests and then the campaigns once they are empty
+#every batch is one DELETE of at most batch_size rows in its own transaction, so other writers wait for one batch at most
+def purge_deleted(batch_size=None):
+    batch_size = batch_size or current_app.config['LIFECYCLE_BATCH_SIZE']
+    counts = {'ad_requests_purged': 0, 'campaigns_purged': 0}
+    while True:
+        ad_requests = db.session.execute(db.delete(AdRequest).where(AdRequest.id.in_(deleted_ad_requests_query(batch_size)))
+                                         .execution_options(synchronize_session=False)).rowcount
+        campaigns = 0 if ad_requests else db.session.execute(db.delete(Campaign).where(Campaign.id.in_(deleted_campaigns_query(batch_size)))
+                                                             .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if not ad_requests and not campaigns:
+            return counts
+        counts['ad_requests_purged'] += ad_requests
+        counts['campaigns_purged'] += campaigns
+        #SQLite's busy handler polls with growing sleeps, without a gap the next batch would take the lock before waiting writers look again
+        time.sleep(current_app.config['PURGE_PAUSE_MS'] / 1000.0)
+
+
+#deletes events older than EVENTS_KEEP_DAYS in batches of batch_size
+#ids grow with time, so the first event to keep is found by walking the old ones and every batch is a range of the primary key
+#the newest event is always kept: SQLite hands out max(id) + 1, so ids are never used twice and no client cursor points past a reused one
+def prune_events(batch_size):
+    cutoff = utcnow() - timedelta(days=current_app.config['EVENTS_KEEP_DAYS'])
+    first_kept = db.session.execute(db.select(Event.id).filter(Event.created_at >= cutoff).order_by(Event.id).limit(1)).scalar()
+    if first_kept is None:
+        first_kept = db.session.execute(db.select(func.max(Event.id))).scalar() or 0
+    pruned = 0
+    while True:
+        deleted = db.session.execute(db.delete(Event).where(Event.id.in_(db.select(Event.id).filter(Event.id < first_kept).order_by(Event.id).limit(batch_size)))
+                                     .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if not deleted:
+            return pruned
+        pruned += deleted
+
+
+lifecycle_lock = threading.Lock()
+purge_lock = threading.Lock()
+
+
+#purges on a daemon thread of this worker right after a campaign was marked deleted, one purge at a time per process
+#anything left by a restart is picked up by the next run of the lifecycle job
+def start_purge(app):
+    def run():
+        with purge_lock, app.app_context():
+            try:
+                counts = purge_deleted()
+                app.logger.info('Purge: %s', counts)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Purge failed')
+    threading.Thread(target=run, name='iescp-purge', daemon=True).start()
+
+
+#runs the lifecycle job every LIFECYCLE_INTERVAL seconds on a daemon thread of this worker process
+#it is started by the worker's first request, so under a preloading server it lives in the forked worker and not in the master
+def start_lifecycle_runner(app):
+    def run():
+        while True:
+            time.sleep(app.config['LIFECYCLE_INTERVAL'])
+            with app.app_context():
+                try:
+                    counts = run_lifecycle()
+                    if any(counts.values()):
+                        app.logger.info('Lifecycle job: %s', counts)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Lifecycle job failed')
+    thread = threading.Thread(target=run, name='iescp-lifecycle', daemon=True)
+    thread.start()
+    app.extensions['lifecycle_runner'] = (os.getpid(), thread)
+
+
+@bp.before_app_request
+def ensure_lifecycle_runner():
+    if current_app.config['LIFECYCLE_INTERVAL'] and current_app.extensions.get('lifecycle_runner', (None,))[0] != os.getpid():
+        with lifecycle_lock:
+            if current_app.extensions.get('lifecycle_runner', (None,))[0] != os.getpid():
+                start_lifecycle_runner(current_app._get_current_object())
+
+
+#the influencer recommendation matrix of the current app, brought up to date before every use
+#built on first use, so workers that never recommend neither import numpy nor hold the matrix
+def recommender():
+    engine = current_app.extensions.get('recommender')
+    if engine is None:
+        from recommendations import InfluencerRecommender
+        engine = current_app.extensions.setdefault('recommender', InfluencerRecommender(current_app.config['RECOMMEND_WEIGHTS'], current_app.config['RECOMMEND_REACH_PER_BUDGET']))
+    engine.refresh(db.session)
+    return engine
+
+
+#create a route ranking every influencer for one of the sponsor's campaigns
+@bp.route("/sponsor/campaigns/<int:campaign_id>/recommendations", methods=['GET'])
+def campaign_recommendations(campaign_id):
+    if 'user_id' in session:
+        if session["is_sponsor"]:
+            campaign = get_own_campaign_or_404(campaign_id)
+            contacted = db.session.execute(db.select(AdRequest.influencer_id).filter(AdRequest.campaign_id == campaign_id, AdRequest.status_adreq.in_(('pending', 'accepted')))).scalars().all()
+            ranked = recommender().recommend(' '.join(filter(None, (campaign.name, campaign.description, campaign.goals))), campaign.budget,
+                                             limit=current_app.config['RECOMMEND_LIMIT'], exclude=contacted)
+            influencers = {user.id: user for user in db.session.execute(db.select(User).filter(User.id.in_([influencer_id for influencer_id, _, _ in ranked]))).scalars()}
+            recommendations = [(influencers[influencer_id], score, parts) for influencer_id, score, parts in ranked if influencer_id in influencers]
+            return render_template('campaign_recommendations.html', campaign=campaign, recommendations=recommendations)
+        flash('Invalid user', 'danger')
+        return redirect('/login')
+    flash('Please login first', 'danger')
+    return redirect('/login')
+
+
+#Prometheus scrape endpoint with the per-route histograms of this worker process
+@bp.route("/metrics", methods=['GET'])
+def metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(request_metrics().render() + password_hasher().render(), mimetype='text/plain; version=0.0.4')
+
+
+#the lookups of the lifecycle and purge jobs, built by the functions the jobs call; the statements of the views are checked by the benchmarks,
+#which run EXPLAIN QUERY PLAN on every statement a route executes
+def job_queries(batch_size=500):
+    return {
+        'lifecycle_expired_campaigns': expired_campaigns_query(datetime.now().date(), batch_size),
+        'lifecycle_stale_ad_requests': stale_ad_requests_query(batch_size),
+        'purge_deleted_ad_requests': deleted_ad_requests_query(batch_size),
+        'purge_deleted_campaigns': deleted_campaigns_query(batch_size),
+    }
+
+
+@bp.cli.command('upgrade-db')
+def upgrade_db_command():
+    print('Database schema is at version', upgrade_db())
+
+
+@bp.cli.command('run-lifecycle')
+@click.option('--batch-size', type=int, help='rows changed per transaction, defaults to LIFECYCLE_BATCH_SIZE')
+@click.option('--today', type=click.DateTime(formats=['%Y-%m-%d']), help='treat this date as today')
+def run_lifecycle_command(batch_size, today):
+    counts = run_lifecycle(today=today.date() if today else None, batch_size=batch_size)
+    print('Completed %(campaigns_completed)d expired campaigns, expired %(ad_requests_expired)d pending ad requests '
+          'and pruned %(feature_changes_pruned)d recommendation feature changes; purged %(ad_requests_purged)d ad requests '
+          'of %(campaigns_purged)d deleted campaigns and pruned %(events_pruned)d old events' % counts)
+
+
+@bp.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    reconcile_stats()
+    print('Platform statistics rebuilt')
+
+
+@bp.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['sponsors', 'influencers', 'campaigns']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), help='file format, by default taken from the extension')
+@click.option('--batch-size', type=int, help='rows inserted per transaction, defaults to IMPORT_BATCH_SIZE')
+@click.option('--workers', type=int, help='password hashing processes, defaults to IMPORT_WORKERS')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), help='CSV report of rejected rows, defaults to PATH.errors.csv')
+@click.option('--checkpoint', help='name the progress is saved under, defaults to KIND:PATH')
+@click.option('--restart', is_flag=True, help='ignore the saved progress and read the file from its first row')
+def import_data_command(kind, path, file_format, batch_size, workers, errors_path, checkpoint, restart):
+    from importer import BulkImporter
+    config = current_app.config
+
+    def invalidate(kind, rows):
+        if kind == 'campaigns':
+            invalidate_dashboards(sponsor_ids=[row['sponsor_id'] for row in rows])
+
+    importer = BulkImporter(db, {'User': User, 'Campaign': Campaign, 'ImportCheckpoint': ImportCheckpoint}, kind, path,
+                            file_format=file_format, batch_size=batch_size or config['IMPORT_BATCH_SIZE'], workers=workers or config['IMPORT_WORKERS'],
+                            password_method=config['PASSWORD_METHOD'], salt_length=config['PASSWORD_SALT_LENGTH'],
+                            checkpoint=checkpoint, errors_path=errors_path, on_batch=invalidate)
+    started = time.perf_counter()
+    counts = importer.run(restart=restart)
+    print('Read %(rows_read)d rows, imported %(imported)d and rejected %(rejected)d, see %(errors_path)s' % counts
+          + (' (resumed after row %d)' % counts['resumed_at'] if counts['resumed_at'] else '')
+          + ' in %.1fs' % (time.perf_counter() - started))
+
+
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    failed = False
+    for name, stmt in job_queries().items():
+        sql = str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+        scans = [step for step in plan if step.startswith('SCAN') and 'USING' not in step and 'VIRTUAL TABLE' not in step]
+        print(('FAIL ' if scans else 'ok   ') + name + ': ' + '; '.join(plan))
+        failed = failed or bool(scans)
+    if failed:
+        raise SystemExit(1)
+
+
+#builds an app from a config class or its name (production, development, testing), IESCP_CONFIG picks one when none is given
+#nothing here touches the database, the schema is set up by the upgrade-db command
+#only SQLite is supported: the migrations, the counters and the event log are SQLite triggers and the searches use FTS5
+def create_app(config=None):
+    app=Flask(__name__, template_folder="templates")
+    if not isinstance(config, type):
+        config=CONFIGS[config or os.environ.get('IESCP_CONFIG', 'production')]
+    app.config.from_object(config)
+    url=make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite':
+        raise RuntimeError('IESCP_DATABASE_URL must be a SQLite URL, got %s' % url.render_as_string(hide_password=True))
+    if url.database in (None, '', ':memory:'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']={}
+    db.init_app(app)
+    with app.app_context():
+        watch_engine(app, db.engine)
+    app.extensions['dashboard_cache']=make_cache(app.config['CACHE_URL'], max_entries=app.config['CACHE_MAX_ENTRIES'], ttl=app.config['CACHE_TTL'])
+    app.extensions['request_metrics']=RequestMetrics()
+    app.extensions['password_hasher']=PasswordHasher(app.config['PASSWORD_METHOD'], salt_length=app.config['PASSWORD_SALT_LENGTH'],
+                                                     workers=app.config['PASSWORD_WORKERS'], queue_max=app.config['PASSWORD_QUEUE_MAX'])
+    app.register_blueprint(bp)
+    return app
+
+
+#the app used by `flask --app main`, gunicorn main:app and the scripts under benchmarks/
+app=create_app()
+
 
 if __name__ == '__main__':
+    #the development server sets the schema up itself so a fresh checkout runs with python main.py
+    with app.app_context():
+        upgrade_db()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,96 @@
+import bisect
+import threading
+
+
+#seconds, from a cache hit up to a page that needs fixing
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+#cumulative histogram per label value in the Prometheus layout
+class Histogram:
+    def __init__(self, name, help, buckets, label='endpoint'):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self.series = {}
+
+    def observe(self, label_value, value):
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        for label_value, (counts, count, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket{%s="%s",le="%s"} %d' % (self.name, self.label, label_value, bound, cumulative))
+            lines.append('%s_count{%s="%s"} %d' % (self.name, self.label, label_value, count))
+            lines.append('%s_sum{%s="%s"} %s' % (self.name, self.label, label_value, repr(total)))
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, *label_values):
+        self.series[label_values] = self.series.get(label_values, 0) + 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        for label_values, value in sorted(self.series.items()):
+            labels = ','.join('%s="%s"' % pair for pair in zip(self.labels, label_values))
+            lines.append('%s{%s} %d' % (self.name, labels, value))
+        return lines
+
+
+#per-route request metrics of this process, every worker keeps its own like the dashboard cache counters
+class RequestMetrics:
+    def __init__(self, prefix='iescp'):
+        self.lock = threading.Lock()
+        self.requests = Counter(prefix + '_requests_total', 'Requests answered', ('endpoint', 'method', 'status'))
+        self.slow_queries = Counter(prefix + '_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS', ('endpoint',))
+        self.budget_exceeded = Counter(prefix + '_query_budget_exceeded_total', 'Requests that ran more queries than their budget', ('endpoint',))
+        self.histograms = {
+            'duration': Histogram(prefix + '_request_duration_seconds', 'Time spent in the view', DURATION_BUCKETS),
+            'queries': Histogram(prefix + '_request_queries', 'SQL statements run per request', QUERY_BUCKETS),
+            'sql': Histogram(prefix + '_request_sql_seconds', 'Time spent running SQL per request', DURATION_BUCKETS),
+            'template': Histogram(prefix + '_request_template_seconds', 'Time spent rendering templates per request', DURATION_BUCKETS),
+            'size': Histogram(prefix + '_response_bytes', 'Response body size, streamed responses are not counted', SIZE_BUCKETS),
+        }
+
+    def observe(self, endpoint, method, status, duration, queries, sql, template, size=None):
+        with self.lock:
+            self.requests.inc(endpoint, method, str(status))
+            self.histograms['duration'].observe(endpoint, duration)
+            self.histograms['queries'].observe(endpoint, queries)
+            self.histograms['sql'].observe(endpoint, sql)
+            self.histograms['template'].observe(endpoint, template)
+            if size is not None:
+                self.histograms['size'].observe(endpoint, size)
+
+    def slow_query(self, endpoint):
+        with self.lock:
+            self.slow_queries.inc(endpoint)
+
+    def over_budget(self, endpoint):
+        with self.lock:
+            self.budget_exceeded.inc(endpoint)
+
+    def render(self):
+        with self.lock:
+            lines = self.requests.render() + self.slow_queries.render() + self.budget_exceeded.render()
+            for histogram in self.histograms.values():
+                lines += histogram.render()
+        return '\n'.join(lines) + '\n'
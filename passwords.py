@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from metrics import DURATION_BUCKETS, Histogram, Counter
+
+
+#raised when more passwords are waiting for the pool than it may queue, the view answers "try again" instead of piling up requests
+class HasherBusy(RuntimeError):
+    pass
+
+
+#runs the password KDF on a small pool of threads next to the request threads
+#hashlib's scrypt and pbkdf2 release the GIL while they work, so other views keep running and at most `workers` cores hash at once
+class PasswordHasher:
+    def __init__(self, method, salt_length=16, workers=0, queue_max=64, prefix='iescp'):
+        #method in werkzeug's full form, e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000, it is compared to the prefix of stored hashes
+        self.method = method
+        self.salt_length = salt_length
+        #half the cores by default, the other half stays free for the views
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.queue_max = queue_max
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+        self.pending = 0
+        self.wait = Histogram(prefix + '_password_wait_seconds', 'Time a password waited for a free hashing thread', DURATION_BUCKETS, label='operation')
+        self.duration = Histogram(prefix + '_password_hash_seconds', 'Time spent hashing or verifying one password', DURATION_BUCKETS, label='operation')
+        self.results = Counter(prefix + '_password_total', 'Passwords hashed or verified', ('operation', 'result'))
+
+    def submit(self, operation, function, *args):
+        with self.lock:
+            if self.pending >= self.workers + self.queue_max:
+                self.results.inc(operation, 'busy')
+                raise HasherBusy('%d passwords are already waiting to be hashed' % self.pending)
+            #threads do not survive a fork, so every worker process starts its own pool on first use
+            if self.pid != os.getpid():
+                self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                self.pid = os.getpid()
+                self.pending = 0
+            self.pending += 1
+            pool = self.pool
+        queued = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                    self.wait.observe(operation, started - queued)
+                    self.duration.observe(operation, time.perf_counter() - started)
+
+        return pool.submit(run).result()
+
+    def hash(self, password):
+        hashed = self.submit('hash', generate_password_hash, password, self.method, self.salt_length)
+        with self.lock:
+            self.results.inc('hash', 'ok')
+        return hashed
+
+    def verify(self, hashed, password):
+        valid = self.submit('verify', check_password_hash, hashed, password)
+        with self.lock:
+            self.results.inc('verify', 'ok' if valid else 'mismatch')
+        return valid
+
+    #true when the stored hash was made with another method, cost or salt length than the configured ones
+    def needs_rehash(self, hashed):
+        method, _, rest = hashed.partition('$')
+        return method != self.method or len(rest.partition('$')[0]) != self.salt_length
+
+    #checks the password and returns (valid, new hash or None), the new hash is set when the stored one uses old parameters
+    def verify_and_update(self, hashed, password):
+        if not self.verify(hashed, password):
+            return False, None
+        if not self.needs_rehash(hashed):
+            return True, None
+        new_hash = self.hash(password)
+        with self.lock:
+            self.results.inc('verify', 'rehashed')
+        return True, new_hash
+
+    def render(self):
+        with self.lock:
+            lines = self.results.render() + self.wait.render() + self.duration.render()
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,147 @@
+import re
+import threading
+
+import numpy as np
+from sqlalchemy import text
+
+
+#spread of the reach fit in natural log units, one unit is a factor of e away from the reach the budget buys
+REACH_SPREAD = 1.0
+
+LOAD_INFLUENCERS = "SELECT id, is_influencer, inf_category, inf_niche, inf_reach FROM users WHERE {where}"
+LOAD_ANSWERS = ("SELECT influencer_id, SUM(status_adreq = 'accepted'), COUNT(*) FROM ad_requests "
+                "WHERE status_adreq IN ('accepted', 'rejected') AND {where} GROUP BY influencer_id")
+
+
+def tokens(value):
+    #lower case words with a plural s dropped, so "Gadgets" in a campaign matches the niche "gadget"
+    return {word[:-1] if len(word) > 3 and word.endswith('s') else word for word in re.findall(r'[a-z0-9]+', (value or '').lower())}
+
+
+#codes for the distinct category or niche strings, code 0 stands for an empty value
+class Vocabulary:
+    def __init__(self):
+        self.codes = {}
+        self.words = [set()]
+
+    def code(self, value):
+        if not value:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.words)
+            self.words.append(tokens(value))
+        return code
+
+    #how much of each value is mentioned in the campaign text, indexed by code
+    def match(self, campaign_words):
+        return np.array([len(words & campaign_words) / len(words) if words else 0.0 for words in self.words], dtype=np.float32)
+
+
+#one row per influencer with the columns the score needs, kept in memory by every worker
+#changes made by any worker reach the others through the influencer_feature_changes table the triggers fill
+class InfluencerRecommender:
+    def __init__(self, weights, reach_per_budget):
+        self.weights = weights
+        self.reach_per_budget = reach_per_budget
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.last_change = None
+        self.rows = {}
+        self.categories = Vocabulary()
+        self.niches = Vocabulary()
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self.category = np.zeros(0, dtype=np.int32)
+        self.niche = np.zeros(0, dtype=np.int32)
+        self.log_reach = np.zeros(0, dtype=np.float32)
+        self.accepted = np.zeros(0, dtype=np.int32)
+        self.answered = np.zeros(0, dtype=np.int32)
+        self.acceptance = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    #brings the matrix up to date: a full load the first time or when the change log was pruned past this worker, else only the changed influencers
+    def refresh(self, session):
+        with self.lock:
+            #two subqueries, so SQLite reads each end of the primary key instead of scanning the log
+            first, last = session.execute(text("SELECT (SELECT MIN(seq) FROM influencer_feature_changes), (SELECT MAX(seq) FROM influencer_feature_changes)")).one()
+            last = last or 0
+            if self.last_change is None or (first is not None and first > self.last_change + 1):
+                self.reset()
+                self.load(session)
+            elif last > self.last_change:
+                ids = session.execute(text("SELECT DISTINCT influencer_id FROM influencer_feature_changes WHERE seq > :seq AND seq <= :last"),
+                                      {'seq': self.last_change, 'last': last}).scalars().all()
+                self.load(session, ids)
+            self.last_change = last
+
+    #reads every influencer, or only the given user ids, and writes their rows; ids that are gone or no longer influencers are switched off
+    #rows are turned into columns once, so a full load of a large directory stays a few passes over plain tuples
+    def load(self, session, ids=None):
+        if ids is None:
+            where, params = "is_influencer = 1", {}
+        else:
+            where, params = "id IN (SELECT value FROM json_each(:ids))", {'ids': '[%s]' % ','.join(map(str, ids))}
+        #plain DB-API tuples, building a result row object per influencer would double the cost of a full load
+        cursor = session.connection().connection.cursor()
+        users = cursor.execute(LOAD_INFLUENCERS.format(where=where), params).fetchall()
+        answers = cursor.execute(LOAD_ANSWERS.format(where='influencer_' + where if ids is not None else '1 = 1'), params).fetchall()
+        cursor.close()
+        user_ids, flags, categories, niches, reaches = zip(*users) if users else ((),) * 5
+        gone = [self.rows[influencer_id] for influencer_id in set(ids or ()) - set(user_ids) if influencer_id in self.rows]
+        self.active[gone] = False
+        if not users:
+            return
+        self.grow([influencer_id for influencer_id in user_ids if influencer_id not in self.rows])
+        rows = np.fromiter(map(self.rows.__getitem__, user_ids), dtype=np.int64, count=len(user_ids))
+        self.active[rows] = np.array(flags, dtype=bool)
+        self.category[rows] = np.fromiter(map(self.categories.code, categories), dtype=np.int32, count=len(rows))
+        self.niche[rows] = np.fromiter(map(self.niches.code, niches), dtype=np.int32, count=len(rows))
+        self.log_reach[rows] = np.log1p(np.array([reach or 0 for reach in reaches], dtype=np.float32))
+        self.accepted[rows] = 0
+        self.answered[rows] = 0
+        answers = [answer for answer in answers if answer[0] in self.rows]
+        if answers:
+            answer_ids, accepted, answered = zip(*answers)
+            answer_rows = np.fromiter(map(self.rows.__getitem__, answer_ids), dtype=np.int64, count=len(answer_ids))
+            self.accepted[answer_rows] = accepted
+            self.answered[answer_rows] = answered
+        #smoothed so an influencer with no answered requests sits at one half
+        self.acceptance[rows] = (self.accepted[rows] + 1) / (self.answered[rows] + 2.0)
+
+    #appends empty rows for influencers seen for the first time
+    def grow(self, new_ids):
+        if not new_ids:
+            return
+        start = len(self.ids)
+        self.rows.update((influencer_id, start + offset) for offset, influencer_id in enumerate(new_ids))
+        self.ids = np.concatenate([self.ids, np.array(new_ids, dtype=np.int64)])
+        for name in ('active', 'category', 'niche', 'log_reach', 'accepted', 'answered', 'acceptance'):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros(len(new_ids), dtype=column.dtype)]))
+
+    #returns [(influencer_id, score, parts)] for the best limit influencers, skipping the ids in exclude
+    def recommend(self, campaign_text, budget, limit=50, exclude=()):
+        with self.lock:
+            words = tokens(campaign_text)
+            parts = {
+                'category': self.categories.match(words)[self.category],
+                'niche': self.niches.match(words)[self.niche],
+                'reach': np.exp(-0.5 * ((self.log_reach - np.float32(np.log1p(max(budget or 0, 0) * self.reach_per_budget))) / np.float32(REACH_SPREAD)) ** 2),
+                'acceptance': self.acceptance,
+            }
+            scores = sum(self.weights[name] * values for name, values in parts.items()).astype(np.float32)
+            scores[~self.active] = -np.inf
+            excluded = [self.rows[influencer_id] for influencer_id in exclude if influencer_id in self.rows]
+            scores[excluded] = -np.inf
+            limit = min(limit, len(scores))
+            if limit <= 0:
+                return []
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            best = best[np.argsort(-scores[best], kind='stable')]
+            return [(int(self.ids[row]), float(scores[row]), {name: float(values[row]) for name, values in parts.items()})
+                    for row in best if np.isfinite(scores[row])]